@@ -1,11 +1,57 @@
+"""
+Registry of the PyForms widgets of the module.
+
+The widgets are listed with their dotted paths, UIDs and menu metadata,
+and only imported when first resolved as attributes of this module, as
+Orquestra does when looking for applications. Processes that never
+render the UI, like the management commands, do not import them.
+"""
+from collections import namedtuple
+from importlib import import_module
+
+
+Widget = namedtuple('Widget', ['path', 'uid', 'menu', 'menu_order'])
+
 # from .overview import HumanResourcesOverviewWidget
 
-from .contracts.contracts_view import Contract
-from .contracts import ContractsListWidget
-from .proposals import ContractProposalsListWidget
+WIDGETS = {
+    'Contract':                    Widget('humanresources.apps.contracts.contracts_view.Contract', None, None, None),
+    'ContractsListWidget':         Widget('humanresources.apps.contracts.contracts_list.ContractsListWidget', 'contracts', 'middle-left>HRDashboard', 3),
+    'ContractProposalsListWidget': Widget('humanresources.apps.proposals.proposals_list.ContractProposalsListWidget', 'proposals', 'middle-left>HRDashboard', 2),
+    'Proposal':                    Widget('humanresources.apps.proposals.proposal_view.Proposal', 'view-proposal', None, None),
+    'HeadcountsReports':           Widget('humanresources.apps.reports.headcounts.HeadcountsReports', 'headcounts-report', 'middle-left>HRDashboard', 20),
+    'PeoplePerYearReport':         Widget('humanresources.apps.reports.people_per_year.PeoplePerYearReport', 'people-per-year-report', 'middle-left>HRDashboard', 21),
+    'ContractsPerYearReport':      Widget('humanresources.apps.reports.contracts_per_year.ContractsPerYearReport', 'contracts-per-year-report', 'middle-left>HRDashboard', 22),
+}
+
+
+def load_widget(name):
+    """
+    Imports the widget class registered with the name.
+    """
+    module_name, class_name = WIDGETS[name].path.rsplit('.', 1)
+    widget = getattr(import_module(module_name), class_name)
+    globals()[name] = widget  # next lookups do not go through __getattr__
+    return widget
+
+
+def load_widgets():
+    return [load_widget(name) for name in WIDGETS]
+
+
+def pyforms_apps():
+    """
+    Returns the widgets dotted paths by UID, in the format of the
+    PYFORMS_APPS setting, without importing them.
+    """
+    return {widget.uid: widget.path for widget in WIDGETS.values() if widget.uid}
+
+
+def __getattr__(name):
+    if name in WIDGETS:
+        return load_widget(name)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
 
-from .proposals.proposal_view import Proposal
 
-from .reports.headcounts import HeadcountsReports
-from .reports.people_per_year import PeoplePerYearReport
-from .reports.contracts_per_year import ContractsPerYearReport
+def __dir__():
+    return sorted(set(globals()) | set(WIDGETS))
@@ -5,6 +5,7 @@ from pyforms.controls import ControlCheckBox
 from pyforms_web.widgets.django import ModelAdminWidget
 
 from humanresources.models import Contract
+from humanresources.apps.search_list import SearchQueryList
 
 from .contracts_form import ContractEditFormWidget
 from .contracts_create import ContractCreateFormWidget
@@ -27,9 +28,13 @@ class ContractsListWidget(ModelAdminWidget):
         'position',
         'start',
         'end',
-        'is_active'
+        # annotated by ContractQuerySet.with_flags
+        'flag_is_active',
     ]
 
+    # the annotations have no verbose name
+    LIST_HEADERS = ['Person', 'Ref', 'Position', 'Start', 'End', 'Active']
+
     SEARCH_FIELDS = [
         'person__full_name__icontains',
         'ref__icontains'
@@ -38,10 +43,23 @@ class ContractsListWidget(ModelAdminWidget):
     LIST_FILTER = [
          # FIXME AttributeError: 'ManyToOneRel' object has no attribute 'get_limit_choices_to'
          'payout__project',
+         'flag_is_active',
+         'flag_is_expiring_soon',
+         'flag_can_be_renewed',
     ]
 
+    FLAG_FILTER_LABELS = {
+        'flag_is_active':        'Active',
+        'flag_is_expiring_soon': 'Expiring soon',
+        'flag_can_be_renewed':   'Can be renewed',
+    }
+
     LIST_ROWS_PER_PAGE = 15
 
+    # pages by the model ordering instead of OFFSET, and searches
+    # through the search index instead of the SEARCH_FIELDS lookups
+    CONTROL_LIST = SearchQueryList
+
     EDITFORM_CLASS = ContractEditFormWidget
     ADDFORM_CLASS = ContractCreateFormWidget
 
@@ -98,6 +116,8 @@ class ContractsListWidget(ModelAdminWidget):
 
         super().__init__(*args, **kwargs)
 
+        self._list.custom_filter_labels.update(self.FLAG_FILTER_LABELS)
+
         if hasattr(self, '_add_btn'):
             self._add_btn.field_css = 'ten wide'
 
@@ -113,6 +133,9 @@ class ContractsListWidget(ModelAdminWidget):
 
     def get_queryset(self, request, qs):
 
+        # computed columns are annotated, see ContractQuerySet.with_flags
+        qs = qs.with_flags()
+
         if self._expiring_filter.value:
             qs = qs.expiring_soon()
 
@@ -1,14 +1,13 @@
-from django.utils import timezone
-import datetime
 
-from django.conf import settings
 from confapp import conf
 
 from pyforms.basewidget import BaseWidget
 from pyforms.controls import ControlQueryList
 from pyforms.controls import ControlQueryCombo
+from pyforms.controls import ControlCheckBox
 
 from humanresources.models import Contract
+from humanresources.expiring_contracts import get_expiring_contracts
 from people.models import Group as ResearchGroup
 
 class ExpiringContracts(BaseWidget):
@@ -41,7 +40,14 @@ class ExpiringContracts(BaseWidget):
             allow_none=True
         )
 
-        self.formset = ['_group','_list']
+        self._payouts_filter = ControlCheckBox(
+            'Days without payouts',
+            default=False,
+            label_visible=False,
+            changed_event=self.__reload_contracts
+        )
+
+        self.formset = [('_group', '_payouts_filter'),'_list']
 
 
         self.__reload_contracts()
@@ -49,22 +55,12 @@ class ExpiringContracts(BaseWidget):
 
     def __reload_contracts(self):
 
-        end_date = timezone.now().date() + datetime.timedelta(settings.ENDING_CONTRACT_WARNING_N_DAYS_BEFORE )
-        
-        contracts = Contract.objects.all()
-        contracts = contracts.extra(where=[
-            "ADDDATE(ADDDATE(start, INTERVAL months_duration MONTH), INTERVAL days_duration-1 DAY) BETWEEN '{0}' AND '{1}'".format(
-                timezone.now().date(), 
-                end_date
-            )
-        ])
-        contracts = contracts.filter(warn_when_ending=True) # alert only the contracts with the flag to send warning emails
-        contracts = contracts.filter(start__lte = timezone.now().date())
-        contracts = contracts.filter(end__gte = timezone.now().date())
-
-        if self._group.value:
-            group = ResearchGroup.objects.get(pk=self._group.value)
-            contracts = contracts.filter(person__group=group)
-        
-        contracts.order_by('end')
-        self._list.value = contracts
\ No newline at end of file
+        # the pks are cached per group and day, see humanresources.expiring_contracts
+        pks = get_expiring_contracts(self._group.value or None)
+
+        contracts = Contract.objects.filter(pk__in=pks).select_related('person')
+
+        if self._payouts_filter.value:
+            contracts = contracts.with_payout_gaps()
+
+        self._list.value = contracts.order_by('end')
\ No newline at end of file
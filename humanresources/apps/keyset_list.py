@@ -0,0 +1,209 @@
+"""
+Query list control paginated by keyset instead of OFFSET.
+
+Each page is fetched after the ordering values of the last row of the
+previous page, so deep pages cost the same as the first one, and the
+total of rows, only used to show the pages, is cached for a while.
+Orderings that are not made of non null model fields ended by a unique
+one, e.g. a sort by an annotated column, are paginated with OFFSET.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
+from django.db.models import BooleanField, Q
+
+from pyforms_web.controls.control_base import ControlBase
+from pyforms_web.controls.control_querylist import ControlQueryList, format_list_column
+from pyforms_web.utils import get_lookup_verbose_name, get_lookup_value
+
+
+def get_count_timeout():
+    return getattr(settings, 'HUMANRESOURCES_LIST_COUNT_CACHE_TIMEOUT', 60)
+
+
+def keyset_ordering(queryset):
+    """
+    Returns the [(field, descending)] ordering of the queryset up to
+    its first unique field, or None if it cannot be used as a keyset.
+    """
+    opts = queryset.model._meta
+
+    ordering = []
+    for term in queryset.query.order_by:
+        if not isinstance(term, str) or term == '?':
+            return None
+        descending = term.startswith('-')
+        name = term.lstrip('-')
+        if name == 'pk':
+            name = opts.pk.name
+        try:
+            field = opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        # relations are ordered by the ordering of the related model
+        if not field.concrete or field.null or field.is_relation:
+            return None
+
+        ordering.append((field, descending))
+        if field.unique:
+            return ordering
+    return None
+
+
+def after(queryset, ordering, values):
+    """
+    Filters the rows that come after the values in the ordering.
+    """
+    condition = Q()
+    equal = {}
+    for (field, descending), value in zip(ordering, values):
+        lookup = '{0}__{1}'.format(field.attname, 'lt' if descending else 'gt')
+        condition |= Q(**equal, **{lookup: value})
+        equal[field.attname] = value
+    return queryset.filter(condition)
+
+
+class KeysetQueryList(ControlQueryList):
+
+    def __init__(self, *args, **kwargs):
+        self._keyset_signature = None
+        self._keyset_cursors = {}
+        super().__init__(*args, **kwargs)
+
+    def get_signature(self, queryset):
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return None
+        return hashlib.md5(repr((sql, params)).encode()).hexdigest()
+
+    def get_total(self, queryset, signature):
+        if signature is None:
+            return 0
+
+        key = 'humanresources:list-count:{0}'.format(signature)
+        total = cache.get(key)
+        if total is None:
+            total = queryset.count()
+            cache.set(key, total, get_count_timeout())
+        return total
+
+    def get_rows(self, queryset, signature):
+        """
+        Returns the rows of the current page, read after the cursor of
+        the nearest page already visited, skipping the pages between.
+        """
+        row_start = self.rows_per_page * (self._current_page - 1)
+        row_end = self.rows_per_page * self._current_page
+
+        ordering = keyset_ordering(queryset)
+        if ordering is None:
+            return self.queryset_to_list(queryset, self.list_display, row_start, row_end)
+
+        # the cursors are only valid for the query they were taken from
+        if signature != self._keyset_signature:
+            self._keyset_signature = signature
+            self._keyset_cursors = {1: None}
+
+        page = max(p for p in self._keyset_cursors if p <= self._current_page)
+        cursor = self._keyset_cursors[page]
+        if cursor is not None:
+            queryset = after(queryset, ordering, cursor)
+
+        skip = self.rows_per_page * (self._current_page - page)
+        objects = list(queryset[skip:skip + self.rows_per_page])
+
+        if len(objects) == self.rows_per_page:
+            last = objects[-1]
+            self._keyset_cursors[self._current_page + 1] = [
+                getattr(last, field.attname) for field, descending in ordering
+            ]
+
+        return self.objects_to_list(objects)
+
+    def objects_to_list(self, objects):
+        if not self.list_display:
+            return [[obj.pk, str(obj)] for obj in objects]
+        return [
+            [obj.pk] + [format_list_column(get_lookup_value(obj, column)) for column in self.list_display]
+            for obj in objects
+        ]
+
+    def serialize_filters(self, list_filter, queryset):
+        """
+        Adds yes/no filters for the boolean annotations of the queryset in
+        the list_filter, e.g. the flags of ContractQuerySet.with_flags,
+        which are not model fields.
+        """
+        annotations = queryset.query.annotations
+        filters = super().serialize_filters([c for c in list_filter if c not in annotations], queryset)
+
+        for column in list_filter:
+            annotation = annotations.get(column)
+            if annotation is None or not isinstance(annotation.output_field, BooleanField):
+                continue
+            filters.append({
+                'field_type': 'combo',
+                'label':      self.custom_filter_labels.get(column, column),
+                'column':     column,
+                'items':      [('{0}=true'.format(column), 'Yes'), ('{0}=false'.format(column), 'No')],
+            })
+        return filters
+
+    def get_pages_list(self, total_n_pages):
+        start_page = max(1, self._current_page - self.n_pages // 2)
+        end_page = min(total_n_pages, start_page + self.n_pages - 1)
+        start_page = max(1, end_page - self.n_pages + 1)
+
+        return (
+            [start_page - 1 if start_page > 1 else -1] +
+            list(range(start_page, end_page + 1)) +
+            [end_page + 1 if end_page < total_n_pages else -1]
+        )
+
+    def serialize(self, init_form=False):
+        data = ControlBase.serialize(self)
+        queryset = self.value
+        signature = self.get_signature(queryset) if queryset is not None else None
+
+        rows = []
+        if self._update_list and queryset is not None:
+            rows = self.get_rows(queryset, signature)
+
+            if init_form:
+                data.update({'filters_list': self.serialize_filters(self.list_filter, queryset)})
+
+        if init_form and self.list_display and (queryset is not None or self.headers):
+            if self.headers is None:
+                labels = [get_lookup_verbose_name(queryset.model, column) for column in self.list_display]
+            else:
+                labels = self.headers
+            data.update({'horizontal_headers': [
+                {'label': label, 'column': column} for label, column in zip(labels, self.list_display)
+            ]})
+
+        if len(self.search_fields) > 0:
+            data.update({'search_field_key': self.search_field_key if self.search_field_key is not None else ''})
+
+        total_rows = self.get_total(queryset, signature) if queryset is not None else 0
+        total_n_pages = -(-total_rows // self.rows_per_page)
+
+        data.update({
+            'columns_align':   self.columns_align,
+            'columns_size':    self.columns_size,
+            'export_csv':      self.export_csv,
+            'filter_by':       self.filter_by,
+            'sort_by':         self.sort_by,
+            'pages':           {
+                'current_page': self._current_page,
+                'pages_list': self.get_pages_list(total_n_pages) if total_rows else [],
+            },
+            'pages_total':     total_n_pages,
+            'value':           rows,
+            'values_total':    total_rows,
+            'selected_row_id': self._selected_row_id,
+        })
+
+        return data
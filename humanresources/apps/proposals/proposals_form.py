@@ -12,6 +12,7 @@ from pyforms_web.widgets.django import ModelFormWidget
 
 from humanresources.models import ContractProposal
 from humanresources.models import Payment
+from humanresources.permission_memo import memoize
 from people.models import Person
 
 from .proposals_create import CreateContractProposalFormWidget
@@ -61,7 +62,10 @@ class PaymentInline(ModelAdminWidget):
     def has_update_permissions(self, obj):
         user = PyFormsMiddleware.user()
         qs = self.parent_model.objects.filter(pk=self.parent_pk)
-        return qs.has_update_permissions(user)
+        return memoize(
+            user, self.parent_model, ['change'], self.parent_pk,
+            lambda: qs.has_update_permissions(user),
+        )
 
     def has_remove_permissions(self, obj):
         return self.has_update_permissions(obj)
@@ -181,17 +185,21 @@ class EditContractProposalFormWidget(CreateContractProposalFormWidget):
 
     @property
     def has_print_permissions(self):
-        if not hasattr(self, '_has_print_permissions'):
-            user = PyFormsMiddleware.user()
-            self._has_print_permissions = ContractProposal.objects.filter(pk=self.object_pk).has_print_permissions(user)
-        return self._has_print_permissions
+        user = PyFormsMiddleware.user()
+        qs = ContractProposal.objects.filter(pk=self.object_pk)
+        return memoize(
+            user, ContractProposal, ['print_proposal'], self.object_pk,
+            lambda: qs.has_print_permissions(user),
+        )
 
     @property
     def has_approve_permissions(self):
-        if not hasattr(self, '_has_approve_permissions'):
-            user = PyFormsMiddleware.user()
-            self._has_approve_permissions = ContractProposal.objects.filter(pk=self.object_pk).has_approve_permissions(user)
-        return self._has_approve_permissions
+        user = PyFormsMiddleware.user()
+        qs = ContractProposal.objects.filter(pk=self.object_pk)
+        return memoize(
+            user, ContractProposal, ['can_approve_contract_proposal'], self.object_pk,
+            lambda: qs.has_approve_permissions(user),
+        )
 
     def get_readonly(self, default):
         if not (self.has_print_permissions or self.has_approve_permissions):
@@ -1,8 +1,14 @@
+from django.urls import reverse
+
 from confapp import conf
+from pyforms.controls import ControlButton
+from pyforms_web.web.middleware import PyFormsMiddleware
 from pyforms_web.widgets.django import ModelAdminWidget
 
 from permissions.models import Permission
 from humanresources.models import ContractProposal
+from humanresources.apps.search_list import SearchQueryList
+from humanresources.permission_memo import memoize
 
 from .proposals_form import EditContractProposalFormWidget
 from .proposals_create import CreateContractProposalFormWidget
@@ -20,7 +26,7 @@ class ContractProposalsListWidget(ModelAdminWidget):
         'person_name',
         'position',
         'start',
-        'end_date',
+        'end',
         'supervisor',
         'status_icon',
     ]
@@ -38,10 +44,15 @@ class ContractProposalsListWidget(ModelAdminWidget):
         'supervisor',
         'created_on',
         'start',
+        'end',
     ]
 
     LIST_ROWS_PER_PAGE = 15
 
+    # pages by the model ordering instead of OFFSET, and searches
+    # through the search index instead of the SEARCH_FIELDS lookups
+    CONTROL_LIST = SearchQueryList
+
     EXPORT_CSV = True
     EXPORT_CSV_COLUMNS = [
         col.strip('_icon')
@@ -63,13 +74,46 @@ class ContractProposalsListWidget(ModelAdminWidget):
     ORQUESTRA_MENU_ICON = 'file outline'
     ORQUESTRA_MENU_ORDER = 2
 
+    def __init__(self, *args, **kwargs):
+
+        user = PyFormsMiddleware.user()
+        self._can_export = memoize(
+            user, ContractProposal, ['print_proposal'], None,
+            lambda: ContractProposal.objects.has_print_permissions(user),
+        )
+
+        if self._can_export:
+            self._export_btn = ControlButton(
+                '<i class="ui icon file pdf outline"></i>Export PDFs',
+                default=self.__export_pdfs_evt,
+                css='basic blue',
+                label_visible=False,
+            )
+
+        super().__init__(*args, **kwargs)
+
+    def get_toolbar_buttons(self, has_add_permission=False):
+        buttons = (
+            (['_add_btn'] if has_add_permission else []) +
+            (['_export_btn'] if self._can_export else [])
+        )
+        return tuple(buttons) if buttons else None
+
+    def __export_pdfs_evt(self):
+        url = reverse('export-proposals', args=[self.uid])
+        self.execute_js('window.open("{0}", "_blank");'.format(url))
+
     @classmethod
     def has_permissions(cls, user):
         if user.is_superuser:
             return True
 
-        return Permission.objects.filter_by_auth_permissions(
-            user=user,
-            model=cls.MODEL,
-            codenames=['add', 'view', 'change'],
-        ).exists()
+        codenames = ['add', 'view', 'change']
+        return memoize(
+            user, cls.MODEL, codenames, None,
+            lambda: Permission.objects.filter_by_auth_permissions(
+                user=user,
+                model=cls.MODEL,
+                codenames=list(codenames),
+            ).exists(),
+        )
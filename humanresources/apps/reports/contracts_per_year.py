@@ -18,10 +18,13 @@ from django.conf import settings
 from pyforms_web.organizers import segment, no_columns
 
 from django.db.models       import Count, Sum
-from dateutil.rrule import rrule, YEARLY, MONTHLY
+from dateutil.rrule import YEARLY, MONTHLY, DAILY
+from dateutil.relativedelta import relativedelta
 from django.utils import timezone
 from django.db.models import Q
 
+from .timeline import headcount_timeline
+
 
 class ContractsPerYearReport(BaseWidget):
 
@@ -40,7 +43,7 @@ class ContractsPerYearReport(BaseWidget):
 
         self._start       = ControlDate('Start')
         self._end         = ControlDate('End')
-        self._period      = ControlCombo('Period', items=[('Yearly', YEARLY),('Monthly', MONTHLY)], default=YEARLY)
+        self._period      = ControlCombo('Period', items=[('Yearly', YEARLY),('Monthly', MONTHLY),('Daily', DAILY)], default=YEARLY)
         self._applybtn    = ControlButton('Apply', default=self.populate_graphs)
 
         self._people_chart  = ControlBarsChart('People per year')
@@ -49,7 +52,7 @@ class ContractsPerYearReport(BaseWidget):
         #self._nation_chart  = ControlPieChart('Nationalities')
 
         self.formset = [
-            no_columns('_start', '_end','_applybtn'),
+            no_columns('_start', '_end', '_period', '_applybtn'),
             segment('h2:People','_people_chart', css='overflow'),
             segment('h2:Growth (people)','_growth0_chart', css='overflow'),
             #segment('h2:Nationalities','_nation_chart', css='overflow'),
@@ -71,62 +74,43 @@ class ContractsPerYearReport(BaseWidget):
     def populate_graphs(self):
         qs = self.get_queryset()
 
-        if not self._start.value:   self._start.value = qs.exclude(start=None).order_by('start').first().start
-        if not self._end.value:     self._end.value   = qs.exclude(end=None).order_by('-end').first().end
-
-        start = self._start.value
-        end   = self._end.value
-
-        start = start.replace(day=1, month=1, year=start.year-1)
-        end   = end.replace(day=31, month=12)
-
-        people_year = []
-        for dt in rrule(YEARLY, dtstart=start, until=end):
-            b = dt.replace(day=1, month=1)
-            e = dt.replace(day=31, month=12)
-
-            q0 = qs.filter( 
-                ( Q(start__gte=b) & Q(end__lte=e ) ) |
-                ( Q(start__range=(b,e)) & Q(end=None) ) |
-                ( Q(start__lte=b) & Q(end=None) ) |
-                ( Q(start__lte=b) & Q(end__range=(b,e)) ) |
-                ( Q(start__range=(b,e)) & Q(end__gte=e) )
-            ).distinct()
-            people_year.append( (dt.year, q0.count()) )
-
-        
-        people_movs = []
-        for dt in rrule(YEARLY, dtstart=start, until=end):
-            b = dt.replace(day=1, month=1)
-            e = dt.replace(day=31, month=12)
-
-            q0 = qs.filter( 
-                Q(start__range=(b,e)) | Q(end__range=(b,e) )
-            ).distinct()
-
-            people_movs.append( (dt.year, q0.count()) )
-
-        people_joins = []
-        for dt in rrule(YEARLY, dtstart=start, until=end):
-            b = dt.replace(day=1, month=1)
-            e = dt.replace(day=31, month=12)
-
-            q0 = qs.filter( 
-                Q(start__range=(b,e))
-            ).distinct()
-            people_joins.append( (dt.year, q0.count()) )
-
-        people_lefts = []
-        for dt in rrule(YEARLY, dtstart=start, until=end):
-            b = dt.replace(day=1, month=1)
-            e = dt.replace(day=31, month=12)
-
-            q0 = qs.filter( 
-                Q(end__range=(b,e))
-            ).distinct()
-            people_lefts.append( (dt.year, q0.count()) )
-
-
+        # load the contracts intervals only once, all the buckets
+        # are computed in memory from these pairs
+        intervals = [(s, e) for pk, s, e in qs.values_list('pk', 'start', 'end')]
+        if not intervals:
+            return
+
+        if not self._start.value:   self._start.value = min((s for s, e in intervals if s is not None), default=None)
+        if not self._end.value:     self._end.value   = max((e for s, e in intervals if e is not None), default=timezone.now().date())
+
+        start  = self._start.value
+        end    = self._end.value
+        period = self._period.value
+
+        # no dates to place in the timeline
+        if start is None:
+            return
+
+        # include the previous bucket to calculate the growth of the first one
+        if period == DAILY:
+            start = start - relativedelta(days=1)
+        elif period == MONTHLY:
+            start = start.replace(day=1) - relativedelta(months=1)
+        else:
+            start = start.replace(day=1, month=1, year=start.year-1)
+            end   = end.replace(day=31, month=12)
+
+        # the range is checked with the previous bucket included
+        try:
+            timeline = headcount_timeline(intervals, start, end, period)
+        except ValueError as e:
+            self.alert(str(e))
+            return
+
+        people_year  = timeline['present']
+        people_movs  = timeline['movements']
+        people_joins = timeline['joins']
+        people_lefts = timeline['lefts']
 
         self._people_chart.value = {
             'People per year':  people_year[1:],
@@ -11,13 +11,15 @@ from pyforms.controls import ControlQueryList
 
 from django.contrib.auth.models import Group
 from django.db.models import Count, Sum
-from humanresources.models import Payout
+from humanresources.models import Payout, PayoutMonth
 from finance.models import Project, CostCenter
 
 from pyforms_web.organizers import segment, no_columns
 from confapp import conf
 from django.conf import settings
 
+from .rollup import rollup
+
 
 class HeadcountsReports(BaseWidget):
 
@@ -31,6 +33,13 @@ class HeadcountsReports(BaseWidget):
 
     AUTHORIZED_GROUPS = ['superuser', settings.PROFILE_HUMAN_RESOURCES]
 
+    ROLLUP_DIMENSIONS = {
+        'projects':    ('project', 'project__costcenter__code', 'project__code', 'project__name'),
+        'groups':      ('project__costcenter__group', 'project__costcenter__group__name'),
+        'fellowships': ('contract__fellowship_type', 'contract__fellowship_type__name'),
+    }
+    ROLLUP_FIELDS = sorted({field for fields in ROLLUP_DIMENSIONS.values() for field in fields})
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -102,38 +111,28 @@ class HeadcountsReports(BaseWidget):
 
     def populate_graphs(self):
         qs = self.get_queryset()
-        
-        qs0 = qs.values(
-            'project__costcenter__code','project__code','project__name'
-        ).annotate(total_amount=Sum('total')).order_by('project')
-        
-        self._projs_pie.value = [( "{0} - {1} - {2}".format(
-            row['project__costcenter__code'],
-            row['project__code'],
-            row['project__name']
 
-        ), row['total_amount']) for row in qs0]
+        # fetch the payouts totals grouped by all the dimensions at once,
+        # each chart breakdown is then rolled up in memory
+        rows = qs.values(*self.ROLLUP_FIELDS).annotate(total_amount=Sum('total')).order_by()
 
+        breakdowns = rollup(rows, self.ROLLUP_DIMENSIONS)
 
-        qs1 = qs.values(
-            'project__costcenter__group__name'
-        ).annotate(total_amount=Sum('total')).order_by('project__costcenter__group')
-        
-        self._grps_pie.value = [(row['project__costcenter__group__name'], row['total_amount']) for row in qs1]
+        self._projs_pie.value = [( "{0} - {1} - {2}".format(
+            costcenter_code,
+            project_code,
+            project_name
 
+        ), total) for (project, costcenter_code, project_code, project_name), total in breakdowns['projects'].items()]
 
+        self._grps_pie.value = [(name, total) for (group, name), total in breakdowns['groups'].items()]
 
-        qs2 = qs.values(
-            'contract__fellowship_type__name'
-        ).annotate(total_amount=Sum('total')).order_by('contract__fellowship_type')
-        
-        self._fellow_pie.value = [(row['contract__fellowship_type__name'], row['total_amount']) for row in qs2]
+        self._fellow_pie.value = [(name, total) for (fellowship_type, name), total in breakdowns['fellowships'].items()]
 
+        # the amounts per year come from the monthly ledger, so payouts
+        # spanning several years are split by the years they cover
+        qs_years = PayoutMonth.objects.filter(payout__in=qs).values(
+            'month__year'
+        ).annotate(total_amount=Sum('amount')).order_by('month__year')
 
-        qs3 = qs.values(
-            'start__year'
-        ).annotate(total_amount=Sum('total')).order_by('start__year')
-        
-        self._amount_chart.value = {'Amount per date':[(row['start__year'], row['total_amount']) for row in qs3]}
-
-        
\ No newline at end of file
+        self._amount_chart.value = {'Amount per date':[(row['month__year'], row['total_amount']) for row in qs_years]}
@@ -0,0 +1,29 @@
+from collections import OrderedDict
+
+
+def _sort_key(key):
+    # NULL values first, as the database would order them
+    return tuple((value is not None, value) for value in key)
+
+
+def rollup(rows, dimensions, measure='total_amount'):
+    """
+    Rolls up the measure of the rows, already grouped by all the
+    dimensions fields, into one breakdown per dimension.
+
+    `dimensions` maps each breakdown name to the tuple of row fields
+    identifying it. Returns a dict with, for each breakdown name, an
+    OrderedDict mapping the fields values tuple to the summed measure.
+    """
+    totals = {name: {} for name in dimensions}
+
+    for row in rows:
+        value = row[measure] or 0
+        for name, fields in dimensions.items():
+            key = tuple(row[field] for field in fields)
+            totals[name][key] = totals[name].get(key, 0) + value
+
+    return {
+        name: OrderedDict(sorted(values.items(), key=lambda item: _sort_key(item[0])))
+        for name, values in totals.items()
+    }
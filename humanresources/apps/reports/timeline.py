@@ -0,0 +1,114 @@
+import calendar
+from datetime import timedelta
+
+import numpy as np
+from dateutil.rrule import rrule, YEARLY, MONTHLY, DAILY
+
+
+#: Longest range, in days, accepted with the DAILY period
+MAX_DAILY_RANGE = 2 * 366
+
+
+def check_range(start, end, period):
+    """
+    Raises ValueError if the range between start and end is too long
+    for the period, to avoid building huge lists of daily buckets.
+    """
+    if period == DAILY and (end - start).days > MAX_DAILY_RANGE:
+        raise ValueError(
+            'The daily period is limited to ranges of {0} days, '
+            'select a shorter range or a longer period.'.format(MAX_DAILY_RANGE)
+        )
+
+
+def period_buckets(start, end, period=YEARLY):
+    """
+    Returns the list of (label, begin, end) buckets covering the
+    dates between start and end for the given period (YEARLY, MONTHLY
+    or DAILY).
+    """
+    check_range(start, end, period)
+
+    buckets = []
+
+    if period == DAILY:
+        for dt in rrule(DAILY, dtstart=start, until=end):
+            b = dt.date()
+            buckets.append((b.isoformat(), b, b))
+    elif period == MONTHLY:
+        start = start.replace(day=1)
+        for dt in rrule(MONTHLY, dtstart=start, until=end):
+            b = dt.date()
+            e = b.replace(day=calendar.monthrange(b.year, b.month)[1])
+            buckets.append((b.strftime('%Y-%m'), b, e))
+    else:
+        start = start.replace(day=1, month=1)
+        for dt in rrule(YEARLY, dtstart=start, until=end):
+            b = dt.date()
+            e = b.replace(day=31, month=12)
+            buckets.append((b.year, b, e))
+
+    return buckets
+
+
+def headcount_timeline(intervals, start, end, period=YEARLY):
+    """
+    Computes the number of intervals present, joining, leaving and
+    moving (joining or leaving) in each bucket of the period between
+    start and end.
+
+    The (start, end) intervals are loaded once into NumPy arrays, each
+    one is assigned to the buckets of its start and end with a
+    searchsorted over the buckets edges and the presence is obtained
+    from the cumulative sum of the start and end deltas. An interval
+    without end is considered open until today and beyond.
+
+    Returns a dict with the keys 'present', 'joins', 'lefts' and
+    'movements', each one a list of (label, count) tuples.
+    """
+    buckets = period_buckets(start, end, period)
+    labels  = [label for label, b, e in buckets]
+    n = len(buckets)
+
+    intervals = [(s, e) for s, e in intervals if s is not None]
+
+    if n == 0 or not intervals:
+        zeros = [(label, 0) for label in labels]
+        return {'present': zeros, 'joins': zeros, 'lefts': zeros, 'movements': zeros}
+
+    # the buckets are contiguous, so the begin of each one plus the day
+    # after the last one delimit them all
+    edges = np.array(
+        [b for label, b, e in buckets] + [buckets[-1][2] + timedelta(days=1)],
+        dtype='datetime64[D]'
+    )
+
+    starts = np.array([s for s, e in intervals], dtype='datetime64[D]')
+    ends   = np.array([e for s, e in intervals], dtype='datetime64[D]')  # None -> NaT
+    closed = ~np.isnat(ends)
+
+    # bucket index of each date: -1 before the first bucket, n after the last
+    s_idx = np.searchsorted(edges, starts, side='right') - 1
+    e_idx = np.full(len(intervals), n)
+    e_idx[closed] = np.searchsorted(edges, ends[closed], side='right') - 1
+
+    inrange_s = (s_idx >= 0) & (s_idx < n)
+    inrange_e = closed & (e_idx >= 0) & (e_idx < n)
+
+    # presence: +1 on the first bucket and -1 after the last bucket
+    valid  = (s_idx <= e_idx) & (s_idx < n) & (e_idx >= 0)
+    deltas = np.bincount(np.clip(s_idx[valid], 0, None), minlength=n + 1)
+    deltas = deltas - np.bincount(np.clip(e_idx[valid], None, n - 1) + 1, minlength=n + 1)
+    present = np.cumsum(deltas)[:n]
+
+    joins = np.bincount(s_idx[inrange_s], minlength=n)
+    lefts = np.bincount(e_idx[inrange_e], minlength=n)
+    both  = np.bincount(s_idx[inrange_s & inrange_e & (s_idx == e_idx)], minlength=n)
+    movements = joins + lefts - both
+
+    return {
+        'present':   list(zip(labels, present.tolist())),
+        'joins':     list(zip(labels, joins.tolist())),
+        'lefts':     list(zip(labels, lefts.tolist())),
+        'movements': list(zip(labels, movements.tolist())),
+    }
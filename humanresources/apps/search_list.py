@@ -0,0 +1,32 @@
+"""
+Query list control that searches through the search index, see
+`humanresources.search`, instead of the SEARCH_FIELDS lookups of the
+widget, which are only used to show the search box.
+"""
+from pyforms_web.controls.control_querylist import ControlQueryList
+
+from humanresources import search
+
+from .keyset_list import KeysetQueryList
+
+
+class SearchQueryList(KeysetQueryList):
+
+    @property
+    def value(self):
+        keywords = self.search_field_key
+
+        # skip the search by the SEARCH_FIELDS lookups
+        self.search_field_key = None
+        try:
+            queryset = ControlQueryList.value.fget(self)
+        finally:
+            self.search_field_key = keywords
+
+        if queryset is not None and keywords and search.is_indexed(queryset.model):
+            queryset = search.search(queryset, keywords)
+        return queryset
+
+    @value.setter
+    def value(self, value):
+        ControlQueryList.value.fset(self, value)
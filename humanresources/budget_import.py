@@ -0,0 +1,596 @@
+"""
+Import of the budget spreadsheets.
+
+The rows of the first sheet, after the "First Name" header row, are
+streamed from the workbook and validated into `BudgetRow` records.
+Each row describes a contract, identified by the person, the contract
+reference and the start date, and a payout of that contract paid by a
+finance project during the requisition period. A contract funded by
+several projects spans several rows. The people, positions,
+fellowship types, projects and existing contracts are resolved through
+dictionaries loaded once, and the contracts and payouts are inserted
+with `bulk_create`, one transaction per chunk of rows.
+
+A fingerprint of each imported row is kept, so importing again the
+same spreadsheet only writes the rows that changed.
+"""
+import datetime
+import hashlib
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from dateutil.relativedelta import relativedelta
+from django.apps import apps
+from django.db import transaction
+from django.utils import timezone
+
+from humanresources import expiring_contracts, search
+from humanresources.search import normalize
+from humanresources.utils import bulk_insert_returns_ids
+
+
+BudgetRow = namedtuple('BudgetRow', [
+    'line',
+    'first_name',
+    'last_name',
+    'position',
+    'project',
+    'fellowship_type',
+    'ref',
+    'start',
+    'end',
+    'requisition_start',
+    'requisition_end',
+    'funding',
+    'project_code',
+    'salary',
+    'salary_from_lab',
+])
+
+HEADER_FIRST_CELL = 'First Name'
+N_COLUMNS = 14
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y')
+
+
+def parse_text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def parse_date(value, field):
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(str(value).strip(), date_format).date()
+        except ValueError:
+            pass
+    raise ValueError("{0}: invalid date '{1}'".format(field, value))
+
+
+def parse_amount(value, field):
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        return Decimal(str(value)).quantize(Decimal('0.01'))
+
+    text = str(value).replace('€', '').replace(' ', '').strip()
+    # 1.234,56 and 1,234.56
+    if ',' in text and text.rfind(',') > text.rfind('.'):
+        text = text.replace('.', '').replace(',', '.')
+    else:
+        text = text.replace(',', '')
+    try:
+        return Decimal(text).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError("{0}: invalid amount '{1}'".format(field, value))
+
+
+def parse_row(line, values):
+    """
+    Validates the cell values of a row into a BudgetRow. Raises
+    ValueError describing every invalid field.
+    """
+    values = list(values[:N_COLUMNS]) + [None] * (N_COLUMNS - len(values))
+
+    errors = {}
+
+    def field(parser, value, name):
+        try:
+            return parser(value, name)
+        except ValueError as e:
+            errors[name] = str(e)
+
+    row = BudgetRow(
+        line=line,
+        first_name=parse_text(values[0]),
+        last_name=parse_text(values[1]),
+        position=parse_text(values[2]),
+        project=parse_text(values[3]),
+        fellowship_type=parse_text(values[4]),
+        ref=parse_text(values[5]),
+        start=field(parse_date, values[6], 'start'),
+        end=field(parse_date, values[7], 'end'),
+        requisition_start=field(parse_date, values[8], 'requisition start'),
+        requisition_end=field(parse_date, values[9], 'requisition end'),
+        funding=parse_text(values[10]),
+        project_code=parse_text(values[11]),
+        salary=field(parse_amount, values[12], 'salary'),
+        salary_from_lab=field(parse_amount, values[13], 'salary from lab'),
+    )
+
+    if not row.first_name and not row.last_name:
+        errors['name'] = 'name: missing'
+    for name in ('start', 'end', 'salary'):
+        if getattr(row, name) is None and name not in errors:
+            errors[name] = '%s: missing' % name
+    if row.start and row.end and row.end < row.start:
+        errors['end'] = 'end: before the start'
+
+    if errors:
+        raise ValueError('; '.join(errors.values()))
+    return row
+
+
+def read_rows(filename):
+    """
+    Streams the (line, values) of the rows after the header row of the
+    first sheet, skipping the empty ones.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(filename, read_only=True, data_only=True)
+    try:
+        ws = wb[wb.sheetnames[0]]
+
+        header_found = False
+        for line, values in enumerate(ws.iter_rows(values_only=True), start=1):
+            if not header_found:
+                first = values[0] if values else None
+                header_found = isinstance(first, str) and first.startswith(HEADER_FIRST_CELL)
+                continue
+
+            if not any(value not in (None, '') for value in values):
+                continue
+            yield line, values
+    finally:
+        wb.close()
+
+
+class Lookups:
+    """
+    Reference objects of the import, loaded once by natural key.
+    """
+
+    def __init__(self):
+        Person = apps.get_model('people', 'Person')
+        Position = apps.get_model('people', 'Position')
+        Project = apps.get_model('finance', 'Project')
+        FellowshipType = apps.get_model('humanresources', 'FellowshipType')
+        Contract = apps.get_model('humanresources', 'Contract')
+
+        self.persons = {}
+        for pk, full_name, first_name, last_name in Person.objects.values_list(
+                'pk', 'full_name', 'first_name', 'last_name'):
+            self.persons.setdefault(normalize(full_name), pk)
+            self.persons.setdefault(normalize('%s %s' % (first_name, last_name)), pk)
+
+        self.positions = {normalize(name): pk for pk, name in Position.objects.values_list('pk', 'name')}
+        self.fellowship_types = {normalize(name): pk for pk, name in FellowshipType.objects.values_list('pk', 'name')}
+
+        self.projects_by_code = {}
+        self.projects_by_name = {}
+        for pk, code, name in Project.objects.values_list('pk', 'code', 'name'):
+            self.projects_by_code[normalize(code)] = pk
+            self.projects_by_name.setdefault(normalize(name), pk)
+
+        self.contracts = {
+            (person_id, ref, start): pk
+            for pk, person_id, ref, start in Contract.objects.values_list('pk', 'person', 'ref', 'start')
+        }
+
+    def resolve(self, row):
+        """
+        Returns the dict of ids referenced by the row. Raises ValueError
+        describing the references not found.
+        """
+        errors = []
+
+        name = '%s %s' % (row.first_name or '', row.last_name or '')
+        person_id = self.persons.get(normalize(name))
+        if person_id is None:
+            errors.append("person: '%s' not found" % name.strip())
+
+        position_id = None
+        if row.position:
+            position_id = self.positions.get(normalize(row.position))
+            if position_id is None:
+                errors.append("position: '%s' not found" % row.position)
+
+        fellowship_type_id = None
+        if row.fellowship_type:
+            fellowship_type_id = self.fellowship_types.get(normalize(row.fellowship_type))
+            if fellowship_type_id is None:
+                errors.append("type: '%s' not found" % row.fellowship_type)
+
+        project_id = None
+        if row.project_code or row.project:
+            project_id = (
+                self.projects_by_code.get(normalize(row.project_code)) or
+                self.projects_by_code.get(normalize(row.project)) or
+                self.projects_by_name.get(normalize(row.project))
+            )
+            if project_id is None:
+                errors.append("project: '%s' not found" % (row.project_code or row.project))
+
+        if errors:
+            raise ValueError('; '.join(errors))
+
+        return {
+            'person_id': person_id,
+            'position_id': position_id,
+            'fellowship_type_id': fellowship_type_id,
+            'project_id': project_id,
+        }
+
+
+def contract_key(row, ids):
+    return (ids['person_id'], row.ref, row.start)
+
+
+def build_contract(row, ids):
+    Contract = apps.get_model('humanresources', 'Contract')
+
+    duration = relativedelta(row.end + datetime.timedelta(days=1), row.start)
+    return Contract(
+        person_id=ids['person_id'],
+        position_id=ids['position_id'],
+        fellowship_type_id=ids['fellowship_type_id'],
+        ref=row.ref,
+        start=row.start,
+        months_duration=duration.years * 12 + duration.months,
+        days_duration=duration.days,
+        end=row.end,
+        salary=row.salary,
+    )
+
+
+CONTRACT_FIELDS = [
+    'position_id', 'fellowship_type_id', 'ref', 'start', 'months_duration', 'days_duration', 'end', 'salary',
+]
+PAYOUT_FIELDS = ['project_id', 'start', 'end', 'amount']
+
+
+def build_payout(row, ids, contract_id):
+    """
+    Returns the payout of the row, or None if the row has no project.
+    The payout amount is the salary paid by the lab, if filled, or
+    else the contract salary.
+    """
+    Payout = apps.get_model('humanresources', 'Payout')
+
+    if ids['project_id'] is None:
+        return None
+
+    return Payout(
+        contract_id=contract_id,
+        project_id=ids['project_id'],
+        start=row.requisition_start or row.start,
+        end=row.requisition_end or row.end,
+        amount=row.salary_from_lab if row.salary_from_lab is not None else row.salary,
+    )
+
+
+def row_key(row, ordinal=0):
+    """
+    Natural key of the row: the person name, the contract reference,
+    the requisition start and the project, so the rows splitting the
+    funding of a contract by projects are all kept, and the ordinal of
+    the row among the ones of the same project.
+    """
+    name = normalize('%s %s' % (row.first_name or '', row.last_name or ''))
+    project = normalize(row.project_code or row.project)
+    return (name[:255], row.ref or '', row.requisition_start or row.start, project[:255], ordinal)
+
+
+def row_digest(row):
+    """
+    Digest of the row contents, without its line number.
+    """
+    return hashlib.sha256(repr(tuple(row[1:])).encode('utf-8')).hexdigest()
+
+
+class BudgetImporter:
+    """
+    Imports the rows of a budget spreadsheet. The errors of the rows
+    not imported are collected in `errors`, as (line, message) tuples.
+
+    The digest of each imported row is stored by its natural key, see
+    `row_key`, so the rows unchanged since the last import are skipped,
+    the changed ones update their contract and payout and only the new
+    ones are inserted. The payouts of the rows no longer in the sheet
+    are removed, unless some rows could not be read.
+    """
+
+    def __init__(self, user, chunk_size=500, dry_run=False):
+        BudgetRowFingerprint = apps.get_model('humanresources', 'BudgetRowFingerprint')
+
+        self.user = user
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+
+        self.lookups = Lookups()
+        self.fingerprints = {fingerprint.key: fingerprint for fingerprint in BudgetRowFingerprint.objects.all()}
+        self.ordinals = {}
+        self.seen = set()
+        self.n_unreadable = 0
+
+        self.errors = []
+        self.n_rows = 0
+        self.n_skipped = 0
+        self.n_updated = 0
+        self.n_inserted = 0
+        self.n_removed = 0
+
+        self._order_lookups = None
+        self._inserted = set()
+
+    def import_file(self, filename):
+        chunk = []
+        for line, values in read_rows(filename):
+            self.n_rows += 1
+            try:
+                row = parse_row(line, values)
+            except ValueError as e:
+                self.errors.append((line, str(e)))
+                self.n_unreadable += 1
+                continue
+
+            # the rows of the same contract, requisition and project are
+            # told apart by their order in the sheet
+            key = row_key(row)
+            ordinal = self.ordinals.get(key, 0)
+            self.ordinals[key] = ordinal + 1
+            key = row_key(row, ordinal)
+            self.seen.add(key)
+
+            digest = row_digest(row)
+            fingerprint = self.fingerprints.get(key)
+            if fingerprint is not None and fingerprint.digest == digest and fingerprint.contract_id is not None:
+                self.n_skipped += 1
+                continue
+
+            try:
+                ids = self.lookups.resolve(row)
+            except ValueError as e:
+                self.errors.append((line, str(e)))
+                continue
+
+            chunk.append((row, ids, key, digest))
+            if len(chunk) >= self.chunk_size:
+                self.write_chunk(chunk)
+                chunk = []
+
+        self.write_chunk(chunk)
+
+        # the key of an unreadable row is unknown, so its payout is kept
+        if not self.dry_run and not self.n_unreadable:
+            self.remove_missing()
+
+    def remove_missing(self):
+        """
+        Removes the payouts and fingerprints of the rows imported before
+        and no longer in the sheet. The contracts are kept.
+        """
+        Payout = apps.get_model('humanresources', 'Payout')
+        BudgetRowFingerprint = apps.get_model('humanresources', 'BudgetRowFingerprint')
+
+        missing = [
+            fingerprint for key, fingerprint in self.fingerprints.items()
+            if key not in self.seen and fingerprint.pk is not None
+        ]
+        if not missing:
+            return
+
+        with transaction.atomic():
+            for payout in Payout.objects.filter(pk__in=[f.payout_id for f in missing if f.payout_id]):
+                payout.delete()
+            BudgetRowFingerprint.objects.filter(pk__in=[f.pk for f in missing]).delete()
+
+        for fingerprint in missing:
+            del self.fingerprints[fingerprint.key]
+        self.n_removed = len(missing)
+
+    def write_chunk(self, chunk):
+        if not chunk or self.dry_run:
+            return
+        try:
+            with transaction.atomic():
+                n_updated, n_inserted = self.write(chunk)
+        except Exception as e:
+            message = 'chunk not imported: {0}: {1}'.format(type(e).__name__, e)
+            self.errors.extend((row.line, message) for row, ids, key, digest in chunk)
+            # the new contracts and fingerprints were rolled back
+            self.lookups.contracts = {
+                key: pk for key, pk in self.lookups.contracts.items() if pk not in self._inserted
+            }
+            self.reload_fingerprints([key for row, ids, key, digest in chunk])
+        else:
+            self.n_updated += n_updated
+            self.n_inserted += n_inserted
+
+    def reload_fingerprints(self, keys):
+        """
+        Restores the fingerprints of the keys as they are in the database.
+        """
+        BudgetRowFingerprint = apps.get_model('humanresources', 'BudgetRowFingerprint')
+
+        pks = []
+        for key in keys:
+            fingerprint = self.fingerprints.get(key)
+            if fingerprint is None:
+                continue
+            if fingerprint.pk is None:
+                del self.fingerprints[key]
+            else:
+                pks.append(fingerprint.pk)
+
+        for fingerprint in BudgetRowFingerprint.objects.filter(pk__in=pks):
+            self.fingerprints[fingerprint.key] = fingerprint
+
+    def write(self, chunk):
+        """
+        Updates the contracts and payouts of the changed rows and inserts
+        the new ones. Returns the number of rows updated and inserted.
+        """
+        Contract = apps.get_model('humanresources', 'Contract')
+        Payout = apps.get_model('humanresources', 'Payout')
+        PayoutMonth = apps.get_model('humanresources', 'PayoutMonth')
+        BudgetRowFingerprint = apps.get_model('humanresources', 'BudgetRowFingerprint')
+
+        # only backends returning the ids of bulk inserts allow linking
+        # the payouts to the inserted contracts
+        can_bulk_insert = bulk_insert_returns_ids()
+
+        self._inserted = set()
+
+        updates = []
+        inserts = []
+        for item in chunk:
+            fingerprint = self.fingerprints.get(item[2])
+            if fingerprint is not None and fingerprint.contract_id is not None:
+                updates.append(item)
+            else:
+                inserts.append(item)
+
+        # changed rows ##############################################################
+        contracts = Contract.objects.in_bulk([self.fingerprints[key].contract_id for row, ids, key, digest in updates])
+        payouts = Payout.objects.in_bulk(
+            [self.fingerprints[key].payout_id for row, ids, key, digest in updates if self.fingerprints[key].payout_id]
+        )
+
+        changed_contracts = {}
+        changed_payouts = []
+        removed_payouts = []
+        new_payouts = []
+        for row, ids, key, digest in updates:
+            fingerprint = self.fingerprints[key]
+            fingerprint.digest = digest
+
+            contract = contracts[fingerprint.contract_id]
+            values = build_contract(row, ids)
+            for field in CONTRACT_FIELDS:
+                setattr(contract, field, getattr(values, field))
+            changed_contracts[contract.pk] = contract
+
+            payout = payouts.get(fingerprint.payout_id)
+            values = build_payout(row, ids, contract.pk)
+            if payout is not None and values is not None:
+                for field in PAYOUT_FIELDS:
+                    setattr(payout, field, getattr(values, field))
+                changed_payouts.append(payout)
+            elif payout is not None:
+                removed_payouts.append(payout)
+                fingerprint.payout = None
+            elif values is not None:
+                values.contract = contract
+                new_payouts.append((values, fingerprint))
+
+        Contract.objects.bulk_update(changed_contracts.values(), CONTRACT_FIELDS)
+        search.update_index(Contract, changed_contracts)
+
+        # new rows ##################################################################
+        new_contracts = {}
+        for row, ids, key, digest in inserts:
+            contract_key_ = contract_key(row, ids)
+            if contract_key_ not in self.lookups.contracts and contract_key_ not in new_contracts:
+                new_contracts[contract_key_] = build_contract(row, ids)
+
+        if can_bulk_insert:
+            Contract.objects.bulk_create(new_contracts.values())
+        else:
+            for contract in new_contracts.values():
+                contract.save()
+
+        for contract_key_, contract in new_contracts.items():
+            self.lookups.contracts[contract_key_] = contract.pk
+            self._inserted.add(contract.pk)
+
+        if can_bulk_insert:
+            search.update_index(Contract, [contract.pk for contract in new_contracts.values()])
+
+        new_fingerprints = []
+        for row, ids, key, digest in inserts:
+            fingerprint = self.fingerprints.get(key)
+            if fingerprint is None:
+                fingerprint = BudgetRowFingerprint(
+                    person_name=key[0], contract_ref=key[1], requisition_start=key[2],
+                    project=key[3], ordinal=key[4],
+                )
+                self.fingerprints[key] = fingerprint
+                new_fingerprints.append(fingerprint)
+            fingerprint.digest = digest
+
+            contract_key_ = contract_key(row, ids)
+            fingerprint.contract_id = self.lookups.contracts[contract_key_]
+
+            payout = build_payout(row, ids, fingerprint.contract_id)
+            if payout is not None:
+                if contract_key_ in new_contracts:
+                    payout.contract = new_contracts[contract_key_]
+                new_payouts.append((payout, fingerprint))
+
+        # payouts ###################################################################
+        if (new_payouts or changed_payouts) and self._order_lookups is None:
+            self._order_lookups = Payout.order_lookups()
+
+        for payout in removed_payouts:
+            payout.delete()
+
+        for payout in changed_payouts:
+            payout.update_order(self.user, self._order_lookups)
+            payout.total = payout.total_amount()
+        Payout.objects.bulk_update(changed_payouts, PAYOUT_FIELDS + ['total'])
+        PayoutMonth.objects.filter(payout__in=changed_payouts).delete()
+
+        for payout, fingerprint in new_payouts:
+            if can_bulk_insert:
+                payout.update_order(self.user, self._order_lookups)
+                payout.total = payout.total_amount()
+            else:
+                payout.save(user=self.user, order_lookups=self._order_lookups)
+
+        if can_bulk_insert:
+            Payout.objects.bulk_create([payout for payout, fingerprint in new_payouts])
+
+        months = [month for payout in changed_payouts for month in PayoutMonth.rows_for(payout)]
+        if can_bulk_insert:
+            months += [month for payout, fingerprint in new_payouts for month in PayoutMonth.rows_for(payout)]
+        PayoutMonth.objects.bulk_create(months)
+
+        for payout, fingerprint in new_payouts:
+            fingerprint.payout = payout
+
+        # fingerprints ##############################################################
+        now = timezone.now()
+        changed_fingerprints = [self.fingerprints[key] for row, ids, key, digest in chunk if self.fingerprints[key].pk]
+        for fingerprint in changed_fingerprints:
+            fingerprint.updated_on = now
+        BudgetRowFingerprint.objects.bulk_update(
+            changed_fingerprints, ['digest', 'contract', 'payout', 'updated_on']
+        )
+        BudgetRowFingerprint.objects.bulk_create(new_fingerprints)
+
+        # the bulk writes do not send the signals that refresh the
+        # dashboard lists of expiring contracts
+        if updates or new_contracts:
+            transaction.on_commit(expiring_contracts.invalidate)
+
+        return len(updates), len(inserts)
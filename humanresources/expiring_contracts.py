@@ -0,0 +1,76 @@
+"""
+Cache of the contracts expiring soon, listed by the home dashboard for
+every user. The lists are cached per research group and day, and are
+invalidated by the signals in `signals.py` when contracts change.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+
+GENERATION_KEY = 'humanresources:expiring-contracts:generation'
+
+
+def get_timeout():
+    return getattr(settings, 'HUMANRESOURCES_DASHBOARD_CACHE_TIMEOUT', 24 * 3600)
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = 0
+        cache.add(GENERATION_KEY, generation, None)
+    return generation
+
+
+def invalidate():
+    """
+    Invalidates the cached lists of every group and day.
+    """
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def compute_expiring_contracts(group_id=None, today=None):
+    """
+    Returns the pks, ordered by end, of the running contracts marked to
+    warn when ending that end in the next ENDING_CONTRACT_WARNING_N_DAYS_BEFORE
+    days, optionally only of the people of a research group.
+    """
+    from humanresources.models import Contract
+
+    if today is None:
+        today = timezone.now().date()
+    end_date = today + timedelta(settings.ENDING_CONTRACT_WARNING_N_DAYS_BEFORE)
+
+    contracts = Contract.objects.filter(
+        end__range=[today, end_date],
+        warn_when_ending=True,  # alert only the contracts with the flag to send warning emails
+        start__lte=today,
+    )
+    if group_id:
+        contracts = contracts.filter(person__group=group_id)
+
+    return list(contracts.order_by('end', 'pk').values_list('pk', flat=True).distinct())
+
+
+def get_expiring_contracts(group_id=None):
+    """
+    Cached version of `compute_expiring_contracts`.
+    """
+    today = timezone.now().date()
+    key = 'humanresources:expiring-contracts:{generation}:{group}:{today}'.format(
+        generation=get_generation(),
+        group=group_id or 'all',
+        today=today.isoformat(),
+    )
+
+    pks = cache.get(key)
+    if pks is None:
+        pks = compute_expiring_contracts(group_id, today)
+        cache.set(key, pks, get_timeout())
+    return pks
@@ -0,0 +1,47 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError, FieldError
+from django.core.management.base import BaseCommand, CommandError
+from humanresources.models import ContractProposal
+from humanresources.utils import approve_proposals
+
+
+class Command(BaseCommand):
+    help = 'Approves the given contract proposals and generates their contracts in a single transaction'
+
+    def add_arguments(self, parser):
+        parser.add_argument('proposals', nargs='+', type=int, help='ids of the proposals to approve')
+        parser.add_argument('--user', required=True, help='username of the user approving the proposals')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError("User '%s' does not exist" % options['user'])
+
+        proposals = ContractProposal.objects.filter(pk__in=options['proposals'])
+
+        missing = set(options['proposals']) - set(proposals.values_list('pk', flat=True))
+        if missing:
+            raise CommandError("Proposals not found: %s" % ', '.join(map(str, sorted(missing))))
+
+        # every proposal must be approvable by the user, not just one of them
+        allowed = proposals.managed_by(user, ['can_approve_contract_proposal'])
+        forbidden = set(options['proposals']) - set(allowed.values_list('pk', flat=True))
+        if forbidden:
+            raise CommandError(
+                "%s cannot approve the proposals: %s" % (user, ', '.join(map(str, sorted(forbidden))))
+            )
+
+        t0 = time.perf_counter()
+        try:
+            contracts = approve_proposals(proposals, user)
+        except (ValidationError, FieldError) as e:
+            raise CommandError(e)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Approved %d proposals in %.2fs" % (len(contracts), time.perf_counter() - t0)
+            )
+        )
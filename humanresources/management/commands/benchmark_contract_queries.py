@@ -0,0 +1,142 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.core.management.base import BaseCommand, CommandError
+from humanresources.models import Contract
+from people.models import Person
+
+
+BENCHMARK_REF = 'BENCHMARK'
+
+# indexes of the date range queries, removed with --compare; the others
+# may be needed by foreign keys, e.g. (person, start) on MySQL
+DATE_INDEXES = ('contract_start_end_idx', 'contract_end_warn_idx')
+
+
+def seed_contracts(n):
+    """
+    Creates n contracts, flagged with the BENCHMARK_REF reference, with
+    random dates in the last 20 years for random existing people.
+    """
+    people = list(Person.objects.values_list('pk', flat=True)[:1000])
+    if not people:
+        raise CommandError('At least one Person is required to seed the contracts')
+
+    today = timezone.now().date()
+    first_day = date(today.year - 20, 1, 1)
+    n_days = (today - first_day).days + 365 * 2
+
+    contracts = []
+    for i in range(n):
+        start = first_day + timedelta(days=random.randrange(n_days))
+        months = random.randint(1, 48)
+        contracts.append(Contract(
+            person_id=random.choice(people),
+            ref=BENCHMARK_REF,
+            start=start,
+            months_duration=months,
+            days_duration=0,
+            # bulk_create does not call save(), which calculates the end
+            end=start + relativedelta(months=months) - timedelta(days=1),
+            salary=Decimal('1000.00'),
+            warn_when_ending=random.random() < 0.8,
+        ))
+    Contract.objects.bulk_create(contracts, batch_size=1000)
+
+
+class Command(BaseCommand):
+    help = """
+    Seeds N contracts and times the Contract date range querysets.
+    With --compare the same queries are also timed without the contracts
+    date range indexes, which are recreated at the end.
+    The seeded contracts are removed at the end.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('n', type=int, help='number of contracts to seed')
+        parser.add_argument('--repeat', type=int, default=5, help='runs per query, the best one is reported')
+        parser.add_argument('--compare', action='store_true', help='time also without the date indexes')
+        parser.add_argument('--explain', action='store_true', help='print the query plans')
+        parser.add_argument('--keep', action='store_true', help='do not remove the seeded contracts')
+
+    def get_queries(self):
+        """
+        Returns the (name, callable) of each query, the callables build
+        the queryset, so the work done building it, e.g. the payout gaps
+        of expiring_payouts, is timed too.
+        """
+        today = timezone.now().date()
+        limit = today + timedelta(days=settings.ENDING_CONTRACT_WARNING_N_DAYS_BEFORE)
+        person_id = Contract.objects.filter(ref=BENCHMARK_REF).values_list('person', flat=True).first()
+
+        return [
+            ('active',           lambda: Contract.objects.active()),
+            ('expiring_soon',    lambda: Contract.objects.expiring_soon()),
+            ('expired',          lambda: Contract.objects.expired()),
+            ('expiring_payouts', lambda: Contract.objects.expiring_payouts()),
+            ('no_active_proposals', lambda: Contract.objects.no_active_proposals()),
+            ('warn_when_ending', lambda: Contract.objects.filter(end__range=[today, limit], warn_when_ending=True)),
+            ('person history',   lambda: Contract.objects.filter(person=person_id).order_by('start')),
+        ]
+
+    def time_queries(self, repeat, explain):
+        results = []
+        for name, query in self.get_queries():
+            best = None
+            for i in range(repeat):
+                t0 = time.perf_counter()
+                n_rows = len(list(query().values_list('pk', flat=True)))
+                elapsed = time.perf_counter() - t0
+                best = elapsed if best is None else min(best, elapsed)
+
+            results.append((name, n_rows, best))
+
+            if explain:
+                self.stdout.write(name)
+                self.stdout.write(query().values_list('pk', flat=True).explain())
+        return results
+
+    def handle(self, *args, **options):
+        n = options['n']
+
+        t0 = time.perf_counter()
+        seed_contracts(n)
+        self.stdout.write("Seeded %d contracts in %.2fs" % (n, time.perf_counter() - t0))
+
+        total = Contract.objects.count()
+
+        try:
+            with_indexes = self.time_queries(options['repeat'], options['explain'])
+            without_indexes = None
+
+            if options['compare']:
+                removed = []
+                try:
+                    for index in Contract._meta.indexes:
+                        if index.name in DATE_INDEXES:
+                            with connection.schema_editor() as schema_editor:
+                                schema_editor.remove_index(Contract, index)
+                            removed.append(index)
+                    without_indexes = self.time_queries(options['repeat'], options['explain'])
+                finally:
+                    for index in removed:
+                        with connection.schema_editor() as schema_editor:
+                            schema_editor.add_index(Contract, index)
+        finally:
+            if not options['keep']:
+                Contract.objects.filter(ref=BENCHMARK_REF).delete()
+
+        self.stdout.write("%-20s %8s %14s %14s" % ('query', 'rows', 'indexed (ms)', 'no index (ms)'))
+        for i, (name, n_rows, elapsed) in enumerate(with_indexes):
+            no_index = '%.2f' % (without_indexes[i][2] * 1000) if without_indexes else '-'
+            self.stdout.write("%-20s %8d %14.2f %14s" % (name, n_rows, elapsed * 1000, no_index))
+
+        self.stdout.write(
+            self.style.SUCCESS("Timed %d queries over %d contracts" % (len(with_indexes), total))
+        )
@@ -0,0 +1,78 @@
+import os
+import statistics
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from humanresources import apps as widgets
+
+
+# runs in a fresh interpreter, so nothing is imported beforehand
+SNIPPET = """
+import time
+t0 = time.perf_counter()
+import django
+django.setup()
+import humanresources.apps
+if %r:
+    humanresources.apps.load_widgets()
+print(time.perf_counter() - t0)
+"""
+
+
+class Command(BaseCommand):
+    help = """
+    Times a cold django.setup() in fresh interpreters with the widgets
+    registered lazily and with all of them imported, as they were
+    before the registry. Also checks that the registry metadata matches
+    the widgets classes.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='interpreters started per scenario')
+
+    def startup_time(self, eager):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        process = subprocess.run(
+            [sys.executable, '-c', SNIPPET % eager],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+            universal_newlines=True,
+        )
+        if process.returncode != 0:
+            raise CommandError(process.stderr[-2000:])
+        return float(process.stdout.strip().splitlines()[-1]) * 1000
+
+    def check_registry(self):
+        errors = []
+        for name, entry in widgets.WIDGETS.items():
+            widget = widgets.load_widget(name)
+            registered = (entry.uid, entry.menu, entry.menu_order)
+            declared = (
+                getattr(widget, 'UID', None),
+                getattr(widget, 'ORQUESTRA_MENU', None),
+                getattr(widget, 'ORQUESTRA_MENU_ORDER', None),
+            )
+            if registered != declared:
+                errors.append("%s: registered %s, declared %s" % (name, registered, declared))
+        return errors
+
+    def handle(self, *args, **options):
+        self.stdout.write("%-8s %10s %10s %10s" % ('widgets', 'best (ms)', 'median', 'worst'))
+
+        results = {}
+        for label, eager in (('lazy', False), ('eager', True)):
+            times = [self.startup_time(eager) for i in range(options['repeat'])]
+            results[label] = min(times)
+            self.stdout.write(
+                "%-8s %10.1f %10.1f %10.1f" % (label, min(times), statistics.median(times), max(times))
+            )
+
+        self.stdout.write("lazy registry saves %.1f ms" % (results['eager'] - results['lazy']))
+
+        errors = self.check_registry()
+        for error in errors:
+            self.stdout.write(self.style.ERROR(error))
+        if errors:
+            raise CommandError("The widgets registry is out of date")
+
+        self.stdout.write(self.style.SUCCESS("The widgets registry matches the widgets"))
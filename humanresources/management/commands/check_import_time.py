@@ -0,0 +1,88 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from humanresources.rendering import LAZY_MODULES
+
+
+# runs in a fresh interpreter, so nothing is imported beforehand
+SNIPPET = """
+import json, sys, time
+import django
+t0 = time.perf_counter()
+django.setup()
+elapsed = time.perf_counter() - t0
+print(json.dumps({'setup': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+
+def measure(module):
+    """
+    Returns the cumulative import time of the module and the time of
+    django.setup(), in milliseconds, and the LAZY_MODULES it loaded.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', SNIPPET],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+        universal_newlines=True,
+    )
+    if process.returncode != 0:
+        raise CommandError(process.stderr[-2000:])
+
+    # lines formatted as "import time: self [us] | cumulative | imported package"
+    cumulative = None
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            cumulative = int(fields[1]) / 1000
+
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    return cumulative, result['setup'] * 1000, result['loaded']
+
+
+class Command(BaseCommand):
+    help = """
+    Measures, in a fresh interpreter, the cumulative time of importing
+    humanresources.models and fails if it exceeds the budget, or if any
+    of the PDF rendering modules is imported on startup.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget', type=float,
+            default=getattr(settings, 'HUMANRESOURCES_IMPORT_TIME_BUDGET', 300),
+            help='maximum import time of humanresources.models in milliseconds'
+        )
+        parser.add_argument('--repeat', type=int, default=3, help='runs, the best one is reported')
+        parser.add_argument('--module', default='humanresources.models', help='module to measure')
+
+    def handle(self, *args, **options):
+        module = options['module']
+
+        best_import = best_setup = None
+        loaded = []
+        for i in range(options['repeat']):
+            import_ms, setup_ms, loaded = measure(module)
+            if import_ms is None:
+                raise CommandError('%s was not imported by django.setup()' % module)
+            best_import = import_ms if best_import is None else min(best_import, import_ms)
+            best_setup = setup_ms if best_setup is None else min(best_setup, setup_ms)
+
+        self.stdout.write("django.setup(): %.1f ms" % best_setup)
+        self.stdout.write("%s: %.1f ms (budget %.1f ms)" % (module, best_import, options['budget']))
+
+        if loaded:
+            raise CommandError('Modules imported on startup: %s' % ', '.join(loaded))
+
+        if best_import > options['budget']:
+            raise CommandError(
+                '%s took %.1f ms to import, over the %.1f ms budget' % (module, best_import, options['budget'])
+            )
+
+        self.stdout.write(self.style.SUCCESS("Import time within budget"))
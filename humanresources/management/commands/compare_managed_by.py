@@ -0,0 +1,103 @@
+import time
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from humanresources.models import Contract
+
+from humanresources.tests.reference import managed_by_reference
+
+from .benchmark_contract_queries import seed_contracts, BENCHMARK_REF
+
+
+class Command(BaseCommand):
+    help = """
+    Checks that every implementation of managed_by returns the same rows
+    as the original joins and DISTINCT filter, for every user and
+    permission, and compares the time they take.
+    """
+
+    #: implementations of managed_by of each model
+    METHODS = {
+        'humanresources.Contract':         ['managed_by_cached', 'managed_by_exists'],
+        'humanresources.ContractProposal': ['managed_by_joins', 'managed_by_exists'],
+    }
+
+    CHECKS = [
+        ('humanresources.Contract',         ['view', 'change']),
+        ('humanresources.Contract',         ['change']),
+        ('humanresources.Contract',         ['delete']),
+        ('humanresources.ContractProposal', ['view', 'change']),
+        ('humanresources.ContractProposal', ['change']),
+        ('humanresources.ContractProposal', ['delete']),
+        ('humanresources.ContractProposal', ['print_proposal']),
+        ('humanresources.ContractProposal', ['can_approve_contract_proposal']),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', nargs='+', help='usernames to check, by default all the active users')
+        parser.add_argument('--seed', type=int, default=0, help='number of contracts to generate before checking')
+        parser.add_argument('--repeat', type=int, default=3, help='runs per query, the best one is reported')
+
+    def run(self, method, user, codenames, repeat):
+        best = None
+        for i in range(repeat):
+            t0 = time.perf_counter()
+            # the codenames list is modified by the permissions lookup
+            pks = set(method(user, list(codenames)).values_list('pk', flat=True))
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        return pks, best
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True, is_superuser=False).order_by('username')
+        if options['users']:
+            users = users.filter(username__in=options['users'])
+
+        if options['seed']:
+            seed_contracts(options['seed'])
+
+        n_checks = 0
+        mismatches = []
+        times = {'reference': 0}
+
+        try:
+            for user in users:
+                for model_label, codenames in self.CHECKS:
+                    objects = apps.get_model(model_label).objects.all()
+
+                    expected, elapsed = self.run(
+                        lambda user, codenames: managed_by_reference(objects, user, codenames),
+                        user, codenames, options['repeat']
+                    )
+                    times['reference'] += elapsed
+
+                    for method in self.METHODS[model_label]:
+                        pks, elapsed = self.run(getattr(objects, method), user, codenames, options['repeat'])
+                        times[method] = times.get(method, 0) + elapsed
+
+                        n_checks += 1
+                        if pks != expected:
+                            mismatches.append((user, model_label, codenames, method, expected - pks, pks - expected))
+        finally:
+            if options['seed']:
+                Contract.objects.filter(ref=BENCHMARK_REF).delete()
+
+        for user, model_label, codenames, method, missing, extra in mismatches:
+            self.stdout.write(
+                self.style.ERROR(
+                    "%s %s %s %s: %d rows missing %s, %d extra rows %s"
+                    % (user, model_label, codenames, method, len(missing), sorted(missing)[:10],
+                       len(extra), sorted(extra)[:10])
+                )
+            )
+
+        for method, elapsed in times.items():
+            self.stdout.write("%-18s %.2f ms" % (method + ':', elapsed * 1000))
+
+        if mismatches:
+            raise CommandError("%d of %d checks returned different rows" % (len(mismatches), n_checks))
+
+        self.stdout.write(
+            self.style.SUCCESS("%d checks returned the same rows" % n_checks)
+        )
@@ -1,90 +1,134 @@
-import datetime, os
+import datetime, os, time
+from collections import OrderedDict
 from django.conf import settings
 from django.utils import timezone
-from django.core.mail import EmailMessage
+from django.core.mail import EmailMessage, get_connection
 from django.contrib.auth.models import Group
+from django.db.models import Exists, OuterRef, F
 from django.template.loader import render_to_string
 from django.core.management.base import BaseCommand
 from humanresources.models import Contract, ContractProposal
 from people.models import Person
 
 
-
-
 class Command(BaseCommand):
     help = 'Sends email with contracts ending to the users with the profile PROFILE_EXPIRING_CONTRACTS_OF_MY_GROUP'
 
-    def get_contracts_expiring(self, end_date, groups):
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='build the emails without sending them')
+
+    def get_contracts_expiring(self, today, end_date):
         """
-        Find the contracts ending, from people that belong to specific Django groups.
+        Find the contracts ending, marked to receive a warning, without a
+        proposal for the same person starting after them. Returns one row
+        per contract and research group of its person, with the group id
+        in the `research_group` attribute.
         """
-        if groups:
-            contracts = Contract.objects.filter(end__range=[timezone.datetime.today().date(), end_date],
-                                                person__group__in=groups)
-            # only the contracts marked to receive a warning alert
-            contracts = contracts.filter(contract_warningemail=True)
-            contracts_expiring = []
-            for contract in contracts:
-                # Check for each contract, if it exists already a proposal created.
-                # if not send a warning email
-                start_proposal = contract.end + datetime.timedelta(days=1)
-                proposals = ContractProposal.objects.filter(person=contract.person)
-                proposals = proposals.filter(start=start_proposal)
-
-                if not proposals.exists():
-                    contracts_expiring.append(contract)
-                
-            # sort and remove duplicated contracts
-            return sorted(list(set(contracts_expiring)), key=lambda x: str(x.person))
-        else:
-            return []
-
+        follow_up = ContractProposal.objects.filter(
+            person=OuterRef('person'),
+            start__gt=OuterRef('end'),
+        )
+        return Contract.objects.filter(
+            end__range=[today, end_date],
+            warn_when_ending=True,
+        ).annotate(
+            has_follow_up=Exists(follow_up),
+            research_group=F('person__group'),
+        ).filter(
+            has_follow_up=False,
+            research_group__isnull=False,
+        ).select_related('person')
 
+    def get_recipients(self):
+        """
+        Returns the users of the notification group with an email, as
+        (email, name, username) tuples mapped to their research groups ids.
+        """
+        rows = Person.objects.filter(
+            auth_user__groups__name=settings.PROFILE_EXPIRING_CONTRACTS_OF_MY_GROUP,
+            group__isnull=False,
+        ).exclude(
+            auth_user__email=''
+        ).values_list(
+            'auth_user__email', 'auth_user__first_name', 'auth_user__last_name', 'auth_user__username', 'group'
+        ).order_by('auth_user__username')
 
+        recipients = OrderedDict()
+        for email, first_name, last_name, username, group in rows:
+            key = (email, '%s %s' % (first_name, last_name), username)
+            recipients.setdefault(key, set()).add(group)
+        return recipients
 
     def handle(self,  *args, **options):
+        t0 = time.perf_counter()
+
         # Calculate the future date used to filter the expiring contracts.
-        end_date = timezone.datetime.today().date() + datetime.timedelta(days=settings.ENDING_CONTRACT_WARNING_N_DAYS_BEFORE)
+        today = timezone.datetime.today().date()
+        deadline = settings.ENDING_CONTRACT_WARNING_N_DAYS_BEFORE
+        end_date = today + datetime.timedelta(days=deadline)
+
+        contracts_by_group = {}
+        for contract in self.get_contracts_expiring(today, end_date):
+            contracts_by_group.setdefault(contract.research_group, {})[contract.pk] = contract
+
+        recipients = self.get_recipients()
+        t_queries = time.perf_counter()
 
-        # Get the Django Group that should be notified about the expiring contracts.
-        notification_group = Group.objects.get(name=settings.PROFILE_EXPIRING_CONTRACTS_OF_MY_GROUP)
+        template = os.path.join('emails', 'contracts_ending.html')
+        subject = f'CNP CORE ({today}): Contracts expiring in the next {deadline} days'
 
+        messages = []
         sent_to_users = []
-        for user in notification_group.user_set.all().order_by('username'):
-            if user.email:
-                send_to = [user.email]
-                try:
-                    person = Person.objects.get(auth_user=user)
-                    researchgroups = person.group_set.all()
-                    # calculate the expering contracts belonging to the user groups
-                    contracts_ending = self.get_contracts_expiring(end_date, researchgroups)
-                    if len(contracts_ending) > 0:
-                        template = os.path.join('emails', 'contracts_ending.html')
-                        rendered_msg = render_to_string(template, 
-                                                        {'contracts_ending': contracts_ending,
-                                                         'link': settings.ENDING_CONTRACT_LINK, 'today': timezone.datetime.today().date(),
-                                                         'pi': '%s %s' % (user.first_name, user.last_name),
-                                                         'deadline': settings.ENDING_CONTRACT_WARNING_N_DAYS_BEFORE,}
-                                                        )
-
-                        # send the email
-                        subject = f'CNP CORE ({timezone.datetime.today().date()}): ' \
-                                  f'Contracts expiring in the next {settings.ENDING_CONTRACT_WARNING_N_DAYS_BEFORE} days'
-                        msg = EmailMessage(subject, rendered_msg, settings.ENDING_CONTRACT_FROM, send_to)
-                        msg.content_subtype = "html"
-                        msg.send()
-                        sent_to_users.append(str(user))
-                except Person.DoesNotExist:
-                    pass
+        for (email, name, username), groups in recipients.items():
+            # the expiring contracts belonging to the user groups
+            contracts_ending = {}
+            for group in groups:
+                contracts_ending.update(contracts_by_group.get(group, {}))
+            if not contracts_ending:
+                continue
+
+            rendered_msg = render_to_string(template, {
+                'contracts_ending': sorted(contracts_ending.values(), key=lambda x: str(x.person)),
+                'link': settings.ENDING_CONTRACT_LINK,
+                'today': today,
+                'pi': name,
+                'deadline': deadline,
+            })
+            msg = EmailMessage(subject, rendered_msg, settings.ENDING_CONTRACT_FROM, [email])
+            msg.content_subtype = "html"
+            messages.append(msg)
+            sent_to_users.append(username)
 
         ### Notify the users in the HR profile about witch users were warned ###########
         group = Group.objects.get(name=settings.PROFILE_HUMAN_RESOURCES)
-        send_to = [user.email for user in group.user_set.all() if user.email]
+        send_to = list(group.user_set.exclude(email='').values_list('email', flat=True))
         rendered_msg = "This report was sent to:<br/><br/>"+'<br/>'.join( sent_to_users )
-        msg = EmailMessage(f'Contracts expiring in the next {settings.ENDING_CONTRACT_WARNING_N_DAYS_BEFORE} days: sending report',
+        msg = EmailMessage(f'Contracts expiring in the next {deadline} days: sending report',
                            rendered_msg,
                            settings.ENDING_CONTRACT_FROM,
                            send_to)
         msg.content_subtype = "html"
-        msg.send()
-        #################################################################################
\ No newline at end of file
+        messages.append(msg)
+        #################################################################################
+        t_render = time.perf_counter()
+
+        n_sent = 0
+        if not options['dry_run']:
+            # all the messages are sent over the same connection
+            connection = get_connection()
+            n_sent = connection.send_messages(messages) or 0
+        t_send = time.perf_counter()
+
+        n_contracts = len({pk for contracts in contracts_by_group.values() for pk in contracts})
+        self.stdout.write(
+            "%d contracts ending, %d recipients, %d messages %s"
+            % (n_contracts, len(sent_to_users), len(messages), 'built' if options['dry_run'] else '(%d sent)' % n_sent)
+        )
+        self.stdout.write(
+            "queries %.1f ms, rendering %.1f ms, sending %.1f ms, total %.1f ms"
+            % ((t_queries - t0) * 1000, (t_render - t_queries) * 1000,
+               (t_send - t_render) * 1000, (t_send - t0) * 1000)
+        )
+        if options['dry_run']:
+            for username in sent_to_users:
+                self.stdout.write("would warn %s" % username)
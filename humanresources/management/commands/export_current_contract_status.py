@@ -1,15 +1,33 @@
 import argparse
+import gzip
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import islice
 
+import django
 from django.apps import apps
 from django.core.management.base import BaseCommand
-from django.db.models import Q
+from django.db import connections
+from django.db.models import Q, Prefetch
 from django.utils.timezone import now
 
 from dateutil.relativedelta import relativedelta
 import csv
 
 
+HEADER = [
+    'name',
+    'position',
+    'salary',
+    'reponsible',
+    'group',
+    'duration',
+    'duration (days)',
+    'notes',
+]
+
+
 def relativedelta_to_str(rd):
     rd_str_parts = []
 
@@ -31,94 +49,206 @@ def valid_date(s):
         raise argparse.ArgumentTypeError(msg)
 
 
-class Command(BaseCommand):
-    help = """
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
 
+def load_people(pks):
+    """
+    Loads the people with the pks, prefetching their contracts, most
+    recent first, and their groups.
+    """
+    Person = apps.get_model('people', 'Person')
+    # the model of person.group_set, research.Group in older installs
+    Group = Person._meta.get_field('group').related_model
+    Contract = apps.get_model('humanresources', 'Contract')
+
+    return Person.objects.filter(pk__in=pks).select_related('position').prefetch_related(
+        Prefetch(
+            'contract_set',
+            queryset=Contract.objects.select_related('position', 'supervisor').order_by('-start'),
+            to_attr='contracts',
+        ),
+        Prefetch(
+            'group_set',
+            queryset=Group.objects.exclude(group_name="Support Units").order_by('pk'),
+            to_attr='groups',
+        ),
+    ).order_by('pk')
+
+
+def inspect_past_contracts(contracts, first_day, supervisor, messages, debug=False):
+    """Inspect previous contracts for continuity.
+    Returns the corrected tuple `(first_day, supervisor, notes)`.
     """
 
-    DEBUG = False
-    CSVFILENAME = 'contracts_report.csv'
+    has_gap = False
+    was_student = False
+    gap_days = 0
 
-    def add_arguments(self, parser):
-        parser.add_argument('--filter', nargs='+', help='filter people names')
-        parser.add_argument(
-            '--today',
-            help="Count days up to - format YYYY-MM-DD",
-            type=valid_date,
-        )
-        parser.add_argument('--debug', action='store_true', help='debug mode')
+    for contract in contracts:
 
-    def export_csv(self, data):
-        with open(self.CSVFILENAME, mode='w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(
-                [
-                    'name',
-                    'position',
-                    'salary',
-                    'reponsible',
-                    'group',
-                    'duration',
-                    'duration (days)',
-                    'notes',
-                ]
-            )
-            for row in data:
-                writer.writerow(row)
+        if 'student' in contract.position.name.lower():
+            was_student = True
+            break
 
-    def inspect_past_contracts(self, person, first_day, supervisor):
-        """Inspect previous contracts for continuity.
-        Returns the corrected tuple `(first_day, supervisor)`.
-        """
+        diff = (first_day - contract.end).days
+        if diff > 1:
+            has_gap = True
+            gap_days += diff
+
+        if supervisor is None:
+            # update supervisor if missing from recent contracts
+            supervisor = contract.supervisor
+
+        if debug:
+            messages.append((None, '  |-->  %s %s %s %d %s %s' % (
+                contract.ref,
+                contract.start,
+                contract.end,
+                (contract.end - contract.start).days,
+                contract.salary,
+                contract.supervisor,
+            )))
 
-        has_gap = False
-        was_student = False
-        gap_days = 0
+        first_day = contract.start
 
-        for contract in person.contract_set.order_by('-start')[1:]:
+    notes = []
+    if has_gap:
+        notes.append(f"Gap detected ({gap_days} days)")
+    if was_student:
+        notes.append("Was student")
 
-            if 'student' in contract.position.name.lower():
-                was_student = True
+    return first_day, supervisor, notes
+
+
+def person_row(person, today, debug=False):
+    """
+    Returns the CSV row of the person and the list of (style, text)
+    messages to report about it. The person contracts and groups must
+    be prefetched, see `load_people`.
+    """
+    notes = []
+    messages = []
+
+    if debug:
+        messages.append((None, "Found %d contracts for %s" % (len(person.contracts), person.name)))
+
+    last_contract = person.contracts[0]
+
+    current_contract = last_contract
+    if not last_contract.start <= today <= last_contract.end:
+        messages.append(('WARNING', "%s contract has expired" % person.name))
+        notes.append("Using expired contract")
+
+    if debug:
+        messages.append((None, '----->  %s %s %s %d %s %s' % (
+            current_contract.ref,
+            current_contract.start,
+            current_contract.end,
+            (current_contract.end - current_contract.start).days,
+            current_contract.salary,
+            current_contract.supervisor,
+        )))
+
+    first_day, supervisor, extra_notes = inspect_past_contracts(
+        person.contracts[1:], current_contract.start, current_contract.supervisor, messages, debug
+    )
+
+    notes.extend(extra_notes)
+
+    total_duration_days = (today - first_day).days
+    total_duration = relativedelta(today, first_day)
+
+    groups = person.groups
+    if groups:
+        if len(groups) > 1:
+            groups_names = ', '.join([group.group_name for group in groups])
+            messages.append((
+                'WARNING',
+                "%s belongs to %d groups: %s" % (person.name, len(groups), groups_names)
+            ))
+            notes.append("Multiple groups: %s" % groups_names)
+
+        current_group_name = groups[0].group_name
+        for group in groups:
+            if group.group_name == "Lab Administration":
+                current_group_name = group.group_name
                 break
+    else:
+        current_group_name = ""
 
-            diff = (first_day - contract.end).days
-            if diff > 1:
-                has_gap = True
-                gap_days += diff
-
-            if supervisor is None:
-                # update supervisor if missing from recent contracts
-                supervisor = contract.supervisor
-
-            if self.DEBUG:
-                print(
-                    '  |-->  ',
-                    contract.ref,
-                    contract.start,
-                    contract.end,
-                    (contract.end - contract.start).days,
-                    contract.salary,
-                    contract.supervisor,
-                )
+    # handle special cases here
+    # TODO
 
-            first_day = contract.start
+    row = [
+        person.name,
+        person.position,
+        f"{current_contract.salary} €",
+        supervisor,
+        current_group_name,
+        relativedelta_to_str(total_duration),
+        total_duration_days,
+        "; ".join(notes),
+    ]
 
-        notes = []
-        if has_gap:
-            notes.append(f"Gap detected ({gap_days} days)")
-        if was_student:
-            notes.append("Was student")
+    if debug:
+        messages.append((None, " | ".join(str(value) for value in row)))
 
-        return first_day, supervisor, notes
+    return [str(value) if value is not None else '' for value in row], messages
 
-    def handle(self, *args, **options):
 
-        self.DEBUG = options['debug']
+def export_chunk(pks, today, debug=False):
+    """
+    Returns the rows and messages of the people with the pks. Also runs
+    in the worker processes of the --jobs option.
+    """
+    if not apps.ready:
+        django.setup()
+
+    results = []
+    for person in load_people(pks):
+        results.append(person_row(person, today, debug))
+    return results
+
+
+class Command(BaseCommand):
+    help = """
+    Exports the current contract of the active people, with the length
+    of their uninterrupted contracts, to a CSV file. The rows are
+    written as they are computed, to a gzip file if the name ends in
+    .gz or to the standard output if the name is '-'.
+    """
 
-        data = []
+    DEBUG = False
+    CSVFILENAME = 'contracts_report.csv'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--filter', nargs='+', help='filter people names')
+        parser.add_argument(
+            '--today',
+            help="Count days up to - format YYYY-MM-DD",
+            type=valid_date,
+        )
+        parser.add_argument('--debug', action='store_true', help='debug mode')
+        parser.add_argument('--output', default=self.CSVFILENAME, help="CSV file, '-' for the standard output")
+        parser.add_argument('--chunk-size', type=int, default=500, help='people loaded per query')
+        parser.add_argument('--jobs', type=int, default=1, help='processes computing the rows')
+
+    def open_output(self, filename):
+        if filename == '-':
+            return sys.stdout
+        if filename.endswith('.gz'):
+            return gzip.open(filename, mode='wt', newline='', encoding='utf-8')
+        return open(filename, mode='w', newline='', encoding='utf-8')
+
+    def get_people(self, options):
         Person = apps.get_model('people', 'Person')
-        Group = apps.get_model('research', 'Group')
 
         # get all active people
         active_people = Person.objects.filter(person_active=True)
@@ -137,126 +267,68 @@ class Command(BaseCommand):
                 query.add(Q(full_name__icontains=s), Q.OR)
             people = people.filter(query)
 
-        n_expected = people.count()
-
-        today = options['today'] or now().date()
+        return people.distinct()
 
-        if self.DEBUG:
-            self.stdout.write(
-                "Inspecting contract information for %d people" % n_expected
+    def compute_rows(self, people, today, options):
+        """
+        Yields the results of each chunk of people, in order.
+        """
+        chunk_size = options['chunk_size']
+        pks = people.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=chunk_size)
+
+        if options['jobs'] <= 1:
+            for chunk in chunks(pks, chunk_size):
+                yield export_chunk(chunk, today, self.DEBUG)
+            return
+
+        pks = list(pks)
+        # the workers open their own connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['jobs']) as executor:
+            yield from executor.map(
+                export_chunk,
+                chunks(pks, chunk_size),
+                (today for chunk in range(0, len(pks), chunk_size)),
+                (self.DEBUG for chunk in range(0, len(pks), chunk_size)),
             )
 
-        for person in people.all():
-
-            notes = []
-
-            if self.DEBUG:
-                self.stdout.write(
-                    "Found %d contracts for %s"
-                    % (person.contract_set.count(), person.name)
-                )
+    def handle(self, *args, **options):
 
-            last_contract = person.contract_set.order_by('start').last()
-
-            if (
-                last_contract.start
-                <= today
-                <= last_contract.end
-            ):
-                current_contract = last_contract
-            else:
-                current_contract = last_contract
-                self.stdout.write(
-                    self.style.WARNING("%s contract has expired" % person.name)
-                )
-                notes.append("Using expired contract")
-
-            # duration =
-
-            if self.DEBUG:
-                print(
-                    '----->  ',
-                    current_contract.ref,
-                    current_contract.start,
-                    current_contract.end,
-                    (current_contract.end - current_contract.start).days,
-                    current_contract.salary,
-                    current_contract.supervisor,
-                )
+        self.DEBUG = options['debug']
 
-            first_day = current_contract.start
-            supervisor = current_contract.supervisor
+        people = self.get_people(options)
+        n_expected = people.count()
 
-            first_day, supervisor, extra_notes = self.inspect_past_contracts(
-                person, first_day, supervisor
-            )
+        today = options['today'] or now().date()
 
-            notes.extend(extra_notes)
-
-            total_duration_days = (today - first_day).days
-            total_duration = relativedelta(today, first_day)
-
-            groups = person.group_set.exclude(group_name="Support Units")
-            groups_number = groups.count()
-            if groups_number > 0:
-                if groups_number > 1:
-                    groups_names = ', '.join([group.group_name for group in groups])
-                    self.stdout.write(
-                        self.style.WARNING(
-                            "%s belongs to %d groups: %s"
-                            % (person.name, groups_number, groups_names)
-                        )
-                    )
-                    notes.append("Multiple groups: %s" % groups_names)
-                try:
-                    current_group_name = groups.get(
-                        group_name="Lab Administration"
-                    ).group_name
-                except Group.DoesNotExist:
-                    current_group_name = groups.first().group_name
-            else:
-                current_group_name = ""
-
-            # handle special cases here
-            # TODO
-
-            if self.DEBUG:
-                self.stdout.write(
-                    " | ".join(
-                        [
-                            person.name,
-                            str(person.position),
-                            f"{current_contract.salary} €",
-                            str(supervisor),
-                            current_group_name,
-                            relativedelta_to_str(total_duration),
-                            str(total_duration_days),
-                            "; ".join(notes),
-                        ]
-                    )
-                )
+        # keep the messages out of the CSV when it goes to the standard output
+        log = self.stderr if options['output'] == '-' else self.stdout
 
-            data.append(
-                [
-                    person.name,
-                    person.position,
-                    f"{current_contract.salary} €",
-                    supervisor,
-                    current_group_name,
-                    relativedelta_to_str(total_duration),
-                    total_duration_days,
-                    "; ".join(notes),
-                ]
-            )
+        if self.DEBUG:
+            log.write("Inspecting contract information for %d people" % n_expected)
 
-        if n_expected == len(data):
-            self.stdout.write(
+        n_rows = 0
+        csvfile = self.open_output(options['output'])
+        try:
+            writer = csv.writer(csvfile)
+            writer.writerow(HEADER)
+
+            for results in self.compute_rows(people, today, options):
+                for row, messages in results:
+                    for style, text in messages:
+                        log.write(getattr(self.style, style)(text) if style else text)
+                    writer.writerow(row)
+                    n_rows += 1
+        finally:
+            if csvfile is not sys.stdout:
+                csvfile.close()
+
+        if n_expected == n_rows:
+            log.write(
                 self.style.SUCCESS(
                     "Exported contract information for %d people to '%s'"
-                    % (n_expected, self.CSVFILENAME)
+                    % (n_expected, options['output'])
                 )
             )
         else:
             raise ConnectionError("Expected number of people mismatch")
-
-        self.export_csv(data)
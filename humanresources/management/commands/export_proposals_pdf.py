@@ -0,0 +1,56 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from humanresources.models import ContractProposal
+from humanresources.pdf_export import export_proposals, FORMAT_PDF, FORMAT_ZIP
+
+
+class Command(BaseCommand):
+    help = """
+    Exports proposals to a zip of PDFs, or to a single merged PDF
+    (requires pypdf or PyPDF2), rendering them in parallel.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='path of the file to write')
+        parser.add_argument('--ids', type=int, nargs='+', help='ids of the proposals, by default all')
+        parser.add_argument('--status', nargs='+', help='export only the proposals with these statuses')
+        parser.add_argument('--format', choices=[FORMAT_ZIP, FORMAT_PDF], default=FORMAT_ZIP)
+        parser.add_argument('--workers', type=int, default=None, help='worker processes, by default one per CPU, 0 to render in this process')
+        parser.add_argument('--timeout', type=float, default=60, help='seconds allowed per document')
+        parser.add_argument('--base-url', default=None, help='URL used to resolve the images of the template')
+
+    def handle(self, *args, **options):
+        proposals = ContractProposal.objects.all()
+        if options['ids']:
+            proposals = proposals.filter(pk__in=options['ids'])
+        if options['status']:
+            proposals = proposals.filter(status__in=options['status'])
+
+        try:
+            data, stats = export_proposals(
+                proposals,
+                output=options['format'],
+                workers=options['workers'],
+                timeout=options['timeout'],
+                base_url=options['base_url'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        # written aside and renamed, so the file is complete once it exists
+        partial = options['output'] + '.part'
+        with open(partial, 'wb') as outfile:
+            outfile.write(data)
+        os.replace(partial, options['output'])
+
+        for proposal, error in stats['errors']:
+            self.stdout.write(self.style.ERROR("%s (%d): %s" % (proposal, proposal.pk, error)))
+
+        elapsed = stats['elapsed']
+        self.stdout.write(
+            "%d documents (%d cached, %d failed) in %.2fs, %.2f documents/s, %.1f KB"
+            % (stats['documents'], stats['cached'], stats['failed'], elapsed,
+               stats['documents'] / elapsed if elapsed else 0, len(data) / 1024)
+        )
+        self.stdout.write(self.style.SUCCESS("Exported to %s" % options['output']))
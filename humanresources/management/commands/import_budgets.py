@@ -1,46 +1,50 @@
+import csv
+import time
+
+from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand, CommandError
-from humanresources.models       import ContractProposal, Contract
+from humanresources.budget_import import BudgetImporter
 
-from openpyxl import Workbook, load_workbook
 
 class Command(BaseCommand):
+    help = """
+    Imports the contracts and payouts of a budget spreadsheet. The rows
+    with errors are reported and not imported. The rows unchanged since
+    they were last imported are skipped, and the payouts of the rows
+    removed from the spreadsheet are deleted.
+    """
 
     def add_arguments(self, parser):
         parser.add_argument('filename', type=str)
+        parser.add_argument('--user', required=True, help='username of the user creating the payouts orders')
+        parser.add_argument('--chunk-size', type=int, default=500, help='rows inserted per transaction')
+        parser.add_argument('--errors', help='write the errors report to this CSV file')
+        parser.add_argument('--dry-run', action='store_true', help='only validate the rows')
 
     def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError("User '%s' does not exist" % options['user'])
 
-        filename = options['filename']
-
-        wb = load_workbook(filename)
-        ws = wb[wb.sheetnames[0]]
-
-        rows = [row for row in ws.iter_rows()]
-        
-        last_row = 0
-        for i, row in enumerate(rows):
-            if row[0].value and row[0].value.startswith("First Name"): 
-                last_row = i
-                break
+        t0 = time.perf_counter()
 
-        person = object()
+        importer = BudgetImporter(user, chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        importer.import_file(options['filename'])
 
-        for i, row in enumerate(rows[last_row+1:]):
+        elapsed = time.perf_counter() - t0
 
-            first               = row[0].value
-            last                = row[1].value
+        for line, message in importer.errors:
+            self.stdout.write(self.style.ERROR("line %d: %s" % (line, message)))
 
-            print(i, first, last)
+        if options['errors']:
+            with open(options['errors'], mode='w', newline='') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(['line', 'error'])
+                writer.writerows(importer.errors)
 
-            position            = row[2].value
-            project             = row[3].value
-            type       = row[4].value
-            ref        = row[5].value
-            start      = row[6].value
-            end        = row[7].value
-            requisition_start   = row[8].value
-            requisition_end     = row[9].value
-            funding             = row[10].value
-            proj                = row[11].value
-            salary              = row[12].value
-            salary_from_lab     = row[13].value
+        self.stdout.write(
+            "%d rows: %d skipped, %d updated, %d inserted, %d removed, %d with errors in %.2fs"
+            % (importer.n_rows, importer.n_skipped, importer.n_updated, importer.n_inserted,
+               importer.n_removed, len(importer.errors), elapsed)
+        )
@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.core.management.base import BaseCommand
+from humanresources.models import Payout, PayoutMonth
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the monthly ledger of all the payouts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='rows inserted per query')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        payouts = Payout.objects.only('pk', 'start', 'end', 'amount', 'project').order_by('pk')
+
+        n_payouts = 0
+        n_rows = 0
+
+        with transaction.atomic():
+            PayoutMonth.objects.all().delete()
+
+            rows = []
+            for payout in payouts.iterator(chunk_size=batch_size):
+                rows.extend(PayoutMonth.rows_for(payout))
+                n_payouts += 1
+
+                if len(rows) >= batch_size:
+                    PayoutMonth.objects.bulk_create(rows, batch_size=batch_size)
+                    n_rows += len(rows)
+                    rows = []
+
+            PayoutMonth.objects.bulk_create(rows, batch_size=batch_size)
+            n_rows += len(rows)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Rebuilt the ledger of %d payouts (%d months)" % (n_payouts, n_rows)
+            )
+        )
@@ -0,0 +1,20 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from humanresources import search
+
+
+class Command(BaseCommand):
+    help = """
+    Rebuilds the search index of the contracts and proposals lists,
+    e.g. after changing the data without the model signals.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='objects indexed per transaction')
+
+    def handle(self, *args, **options):
+        for label in search.SEARCH_FIELDS:
+            n = search.rebuild_index(apps.get_model(label), chunk_size=options['chunk_size'])
+            self.stdout.write("%s: %d objects indexed" % (label, n))
+
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from humanresources.utils import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = """
+    Delivers the emails queued in the outbox. With --loop the command
+    keeps running as a worker, polling the outbox every --interval seconds.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='emails sent per batch')
+        parser.add_argument('--loop', action='store_true', help='keep polling the outbox')
+        parser.add_argument('--interval', type=float, default=10, help='seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        while True:
+            total_sent = total_retried = total_failed = 0
+
+            # drain every due email before waiting for the next poll
+            try:
+                while True:
+                    sent, retried, failed = send_queued_emails(batch_size)
+                    total_sent += sent
+                    total_retried += retried
+                    total_failed += failed
+                    if sent + retried + failed < batch_size:
+                        break
+            except Exception as e:
+                # the worker keeps polling, e.g. while the database is down
+                if not options['loop']:
+                    raise
+                self.stderr.write("Failed to send the queued emails: %s" % e)
+
+            if total_sent or total_retried or total_failed or not options['loop']:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        "%d emails sent, %d to retry, %d failed" % (total_sent, total_retried, total_failed)
+                    )
+                )
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
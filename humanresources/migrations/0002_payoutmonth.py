@@ -0,0 +1,88 @@
+import datetime
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# frozen copies of humanresources.models.payout functions, so later
+# changes to them do not change what this migration does
+
+def prorated_amount(amount, start, end):
+    diff = relativedelta(end + datetime.timedelta(1), start)
+    if amount is None:
+        amount = 0.0
+    return float(diff.years)*12*float(amount)+float(diff.months)*float(amount)+float(diff.days)*(float(amount)/30)
+
+
+def monthly_amounts(amount, start, end):
+    if start is None or end is None or end < start:
+        return []
+
+    amounts = []
+    accumulated = Decimal('0.00')
+    month = start.replace(day=1)
+    while month <= end:
+        month_end = month + relativedelta(months=1) - datetime.timedelta(1)
+        until = min(month_end, end)
+
+        value = Decimal(str(round(prorated_amount(amount, start, until), 2)))
+        amounts.append((month, value - accumulated))
+        accumulated = value
+
+        month = month_end + datetime.timedelta(1)
+
+    return amounts
+
+
+def populate_ledger(apps, schema_editor):
+    Payout = apps.get_model('humanresources', 'Payout')
+    PayoutMonth = apps.get_model('humanresources', 'PayoutMonth')
+
+    rows = []
+    payouts = Payout.objects.exclude(start=None).exclude(end=None).order_by('pk')
+    for payout in payouts.iterator():
+        for month, amount in monthly_amounts(payout.amount, payout.start, payout.end):
+            rows.append(PayoutMonth(payout_id=payout.pk, project_id=payout.project_id, month=month, amount=amount))
+
+        if len(rows) >= 1000:
+            PayoutMonth.objects.bulk_create(rows)
+            rows = []
+
+    PayoutMonth.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0001_initial'),
+        ('humanresources', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayoutMonth',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Month')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Amount')),
+                ('payout', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='humanresources.Payout', verbose_name='Payout')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='finance.Project', verbose_name='Finance Project')),
+            ],
+            options={
+                'verbose_name': 'payout month',
+                'verbose_name_plural': 'payouts months',
+                'ordering': ['month'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='payoutmonth',
+            index=models.Index(fields=['month', 'project'], name='payoutmonth_month_project_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payoutmonth',
+            index=models.Index(fields=['project', 'month'], name='payoutmonth_project_month_idx'),
+        ),
+        migrations.RunPython(populate_ledger, migrations.RunPython.noop),
+    ]
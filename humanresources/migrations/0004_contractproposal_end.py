@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from dateutil.relativedelta import relativedelta
+from django.db import migrations, models
+
+
+def populate_end(apps, schema_editor):
+    ContractProposal = apps.get_model('humanresources', 'ContractProposal')
+
+    proposals = []
+    for proposal in ContractProposal.objects.exclude(start=None).iterator():
+        months = proposal.months_duration or 0
+        days = proposal.days_duration or 0
+        proposal.end = proposal.start + relativedelta(months=months, days=days) - timedelta(days=1)
+        proposals.append(proposal)
+
+    ContractProposal.objects.bulk_update(proposals, ['end'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('humanresources', '0003_contract_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contractproposal',
+            name='end',
+            field=models.DateField(blank=True, db_index=True, null=True, verbose_name='End date'),
+        ),
+        migrations.RunPython(populate_end, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('humanresources', '0004_contractproposal_end'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255, verbose_name='Subject')),
+                ('context', models.TextField(default='{}', help_text='JSON', verbose_name='Message context')),
+                ('recipient_list', models.TextField(blank=True, default='', help_text='One email per line', verbose_name='Recipients')),
+                ('recipient_group', models.CharField(blank=True, default='', max_length=150, verbose_name='Recipients auth group')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=7, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')),
+                ('next_attempt', models.DateTimeField(auto_now_add=True, verbose_name='Next attempt')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Last error')),
+                ('created_on', models.DateTimeField(auto_now_add=True, verbose_name='Created on')),
+                ('sent_on', models.DateTimeField(blank=True, null=True, verbose_name='Sent on')),
+            ],
+            options={
+                'verbose_name': 'queued email',
+                'verbose_name_plural': 'queued emails',
+                'ordering': ['next_attempt'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='queuedemail',
+            index=models.Index(fields=['status', 'next_attempt'], name='queuedemail_status_next_idx'),
+        ),
+    ]
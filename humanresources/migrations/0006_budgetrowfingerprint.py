@@ -0,0 +1,30 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('humanresources', '0005_queuedemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BudgetRowFingerprint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('person_name', models.CharField(help_text='Normalized', max_length=255, verbose_name='Person name')),
+                ('contract_ref', models.CharField(blank=True, default='', max_length=50, verbose_name='Contract ref.')),
+                ('requisition_start', models.DateField(verbose_name='Requisition start')),
+                ('digest', models.CharField(max_length=64, verbose_name='Row digest')),
+                ('updated_on', models.DateTimeField(auto_now=True, verbose_name='Updated on')),
+                ('contract', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='humanresources.Contract')),
+                ('payout', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='humanresources.Payout')),
+            ],
+            options={
+                'verbose_name': 'budget row fingerprint',
+                'verbose_name_plural': 'budget rows fingerprints',
+                'unique_together': {('person_name', 'contract_ref', 'requisition_start')},
+            },
+        ),
+    ]
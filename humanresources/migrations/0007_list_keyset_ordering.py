@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('humanresources', '0006_budgetrowfingerprint'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='contract',
+            options={'ordering': ['-end', 'id'], 'verbose_name': 'contract', 'verbose_name_plural': 'contracts'},
+        ),
+        migrations.AlterModelOptions(
+            name='contractproposal',
+            options={
+                'ordering': ['-created_on', 'id'],
+                'permissions': (
+                    ('print_proposal', 'Print Proposal'),
+                    ('can_approve_contract_proposal', 'Approve or reject Proposals'),
+                ),
+                'verbose_name': 'Contract proposal',
+                'verbose_name_plural': 'Contract proposals',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='contract',
+            index=models.Index(fields=['-end', 'id'], name='contract_end_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contractproposal',
+            index=models.Index(fields=['-created_on', 'id'], name='proposal_created_id_idx'),
+        ),
+    ]
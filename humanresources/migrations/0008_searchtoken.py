@@ -0,0 +1,87 @@
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+# frozen copies of the fields and the tokenizer of humanresources.search,
+# so later changes to it do not change what this migration does
+
+SEARCH_FIELDS = {
+    'humanresources.contract': (
+        'person__full_name',
+        'ref',
+    ),
+    'humanresources.contractproposal': (
+        'person__first_name',
+        'person__last_name',
+        'person__full_name',
+        'person_name',
+    ),
+}
+
+MAX_TOKEN_LENGTH = 100
+
+
+def normalize(text):
+    if text is None:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.casefold().split())
+
+
+def tokenize(text):
+    return {word[:MAX_TOKEN_LENGTH] for word in re.findall(r'\w+', normalize(text))}
+
+
+def populate_index(apps, schema_editor):
+    SearchToken = apps.get_model('humanresources', 'SearchToken')
+
+    for label, fields in SEARCH_FIELDS.items():
+        model = apps.get_model(label)
+
+        tokens = []
+        for pk, *values in model._base_manager.order_by('pk').values_list('pk', *fields).iterator():
+            words = set()
+            for value in values:
+                words |= tokenize(value)
+            tokens += [SearchToken(model=label, object_id=pk, token=word) for word in sorted(words)]
+
+            if len(tokens) >= 1000:
+                SearchToken.objects.bulk_create(tokens)
+                tokens = []
+
+        SearchToken.objects.bulk_create(tokens)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('humanresources', '0007_list_keyset_ordering'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, verbose_name='Model')),
+                ('object_id', models.PositiveIntegerField(verbose_name='Object id')),
+                ('token', models.CharField(max_length=100, verbose_name='Token')),
+            ],
+            options={
+                'verbose_name': 'search token',
+                'verbose_name_plural': 'search tokens',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='searchtoken',
+            index=models.Index(fields=['model', 'token', 'object_id'], name='searchtoken_token_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='searchtoken',
+            index=models.Index(fields=['model', 'object_id'], name='searchtoken_object_idx'),
+        ),
+        migrations.RunPython(populate_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+import unicodedata
+
+from django.db import migrations, models
+
+
+# frozen copy of humanresources.search.normalize, so later changes to
+# it do not change what this migration does
+def normalize(text):
+    if text is None:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.casefold().split())
+
+
+def populate_project(apps, schema_editor):
+    """
+    Keys the existing fingerprints by the project of their payout, as
+    the rows are keyed by the import.
+    """
+    BudgetRowFingerprint = apps.get_model('humanresources', 'BudgetRowFingerprint')
+
+    fingerprints = []
+    queryset = BudgetRowFingerprint.objects.exclude(payout=None).select_related('payout__project').order_by('pk')
+    for fingerprint in queryset.iterator():
+        fingerprint.project = normalize(fingerprint.payout.project.code)[:255]
+        fingerprints.append(fingerprint)
+
+        if len(fingerprints) >= 1000:
+            BudgetRowFingerprint.objects.bulk_update(fingerprints, ['project'])
+            fingerprints = []
+
+    BudgetRowFingerprint.objects.bulk_update(fingerprints, ['project'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('humanresources', '0008_searchtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budgetrowfingerprint',
+            name='project',
+            field=models.CharField(blank=True, default='', help_text='Normalized', max_length=255, verbose_name='Project'),
+        ),
+        migrations.AddField(
+            model_name='budgetrowfingerprint',
+            name='ordinal',
+            field=models.PositiveIntegerField(default=0, help_text='Order among the rows of the same project', verbose_name='Ordinal'),
+        ),
+        migrations.RunPython(populate_project, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='budgetrowfingerprint',
+            unique_together={('person_name', 'contract_ref', 'requisition_start', 'project', 'ordinal')},
+        ),
+    ]
@@ -1,9 +1,17 @@
+from .budget_fingerprint import BudgetRowFingerprint
 from .fellowship_type import FellowshipType
 from .id_document import IDDocument
 from .payment import Payment
 from .payout import Payout
+from .payout_month import PayoutMonth
 from .privateinfo.privateinfo import PrivateInfo
+from .queued_email import QueuedEmail
+from .search_token import SearchToken
 
 from .proposal.proposal import ContractProposal
 from .contract.contract import Contract
 from .contract.contract_file import ContractFile
+
+# the app config in apps.py is shadowed by the apps package, so its
+# ready() does not run: connect the signals once the models are loaded
+from humanresources import signals  # noqa
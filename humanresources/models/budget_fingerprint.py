@@ -0,0 +1,34 @@
+from django.db import models
+
+
+class BudgetRowFingerprint(models.Model):
+    """
+    Digest of the contents of an imported budget spreadsheet row, by
+    the row natural key, so the next imports of the same spreadsheet
+    skip the unchanged rows.
+    """
+
+    person_name       = models.CharField('Person name', max_length=255, help_text='Normalized')
+    contract_ref      = models.CharField('Contract ref.', max_length=50, blank=True, default='')
+    requisition_start = models.DateField('Requisition start')
+    project           = models.CharField('Project', max_length=255, blank=True, default='', help_text='Normalized')
+    ordinal           = models.PositiveIntegerField('Ordinal', default=0, help_text='Order among the rows of the same project')
+
+    digest     = models.CharField('Row digest', max_length=64)
+    contract   = models.ForeignKey('Contract', blank=True, null=True, on_delete=models.SET_NULL)
+    payout     = models.ForeignKey('Payout', blank=True, null=True, on_delete=models.SET_NULL)
+    updated_on = models.DateTimeField('Updated on', auto_now=True)
+
+    class Meta:
+        verbose_name = "budget row fingerprint"
+        verbose_name_plural = "budget rows fingerprints"
+        unique_together = (('person_name', 'contract_ref', 'requisition_start', 'project', 'ordinal'), )
+
+    def __str__(self):
+        return '{0} {1} {2} {3} {4}'.format(
+            self.person_name, self.contract_ref, self.requisition_start, self.project, self.ordinal
+        )
+
+    @property
+    def key(self):
+        return (self.person_name, self.contract_ref, self.requisition_start, self.project, self.ordinal)
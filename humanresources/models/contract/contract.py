@@ -70,9 +70,19 @@ class Contract(models.Model):
     objects = ContractQuerySet.as_manager()
 
     class Meta:
-        ordering = ['-end', ]
+        ordering = ['-end', 'id']
         verbose_name = "contract"
         verbose_name_plural = "contracts"
+        indexes = [
+            # active(), expiring_soon() and expired() date ranges
+            models.Index(fields=['start', 'end'], name='contract_start_end_idx'),
+            # expiring contracts with warnings, dashboards and commands
+            models.Index(fields=['end', 'warn_when_ending'], name='contract_end_warn_idx'),
+            # contracts history of a person
+            models.Index(fields=['person', 'start'], name='contract_person_start_idx'),
+            # keyset pagination of the contracts list
+            models.Index(fields=['-end', 'id'], name='contract_end_id_idx'),
+        ]
 
 
     def __str__(self):
@@ -100,7 +110,7 @@ class Contract(models.Model):
     def is_expiring_soon(self):
         days_to_end = self.end - timezone.now().date()
         is_expiring = 0 <= days_to_end.days <= settings.ENDING_CONTRACT_WARNING_N_DAYS_BEFORE
-        return self.is_active and is_expiring
+        return self.is_active() and is_expiring
     is_expiring_soon.short_description = 'expiring soon'
     is_expiring_soon.boolean = True
 
@@ -172,9 +182,12 @@ class Contract(models.Model):
     #     print('got', proposal)
     #     return proposal
 
-    def save(self, *args, **kwargs):
+    def calculate_end(self):
         days = 0 if self.days_duration == None else self.days_duration
-        self.end = self.start + relativedelta(months=self.months_duration, days=days) - timedelta(days=1)
+        return self.start + relativedelta(months=self.months_duration, days=days) - timedelta(days=1)
+
+    def save(self, *args, **kwargs):
+        self.end = self.calculate_end()
         super().save(*args, **kwargs)
 
 
@@ -1,14 +1,41 @@
+from datetime import timedelta
 from dateutil.relativedelta import relativedelta
 
 from django.conf import settings
 from django.db import models
-from django.db.models import Q, F
+from django.apps import apps
+from django.db.models import Q, F, Exists, OuterRef, Case, When, Value, BooleanField
 from django.utils import timezone
 from django.contrib.auth.models import User
 
 from people.models import Person
 from permissions.models         import Permission
 from humanresources.models import ContractProposal
+from humanresources.visibility import get_visibility, memberships_filter, SCOPE_ALL, SCOPE_GROUPS
+
+
+def uncovered_ranges(start, end, intervals):
+    """
+    Returns the (start, end) date ranges between start and end, both
+    inclusive, not covered by any of the intervals. The (start, end)
+    intervals must be sorted by start, an interval without end covers
+    every day after its start.
+    """
+    gaps = []
+    cursor = start
+    for interval_start, interval_end in intervals:
+        if interval_start > end:
+            break
+        if interval_end is not None and interval_end < cursor:
+            continue
+        if interval_start > cursor:
+            gaps.append((cursor, interval_start - timedelta(days=1)))
+        if interval_end is None or interval_end >= end:
+            return gaps
+        cursor = max(cursor, interval_end + timedelta(days=1))
+    gaps.append((cursor, end))
+    return gaps
+
 
 class ContractQuerySet(models.QuerySet):
 
@@ -30,16 +57,85 @@ class ContractQuerySet(models.QuerySet):
         now = timezone.now()
         return self.filter(end__lt=now)
 
+    def with_flags(self, today=None):
+        """
+        Annotates the flag_is_active, flag_is_expiring_soon and
+        flag_can_be_renewed flags, the values of the methods without the
+        flag_ prefix computed by the database for a single date, and
+        selects the related objects used to display the contracts.
+
+        The lists use the annotations to display, sort and filter the
+        contracts without a query per row.
+        """
+        if today is None:
+            today = timezone.now().date()
+        limit_date = today + timedelta(days=settings.ENDING_CONTRACT_WARNING_N_DAYS_BEFORE)
+
+        def flag(condition):
+            return Case(
+                When(condition, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            )
+
+        active = Q(start__lte=today, end__gte=today)
+        expiring_soon = active & Q(end__lte=limit_date)
+
+        return self.select_related('person', 'position', 'supervisor').annotate(
+            flag_is_active=flag(active),
+            flag_is_expiring_soon=flag(expiring_soon),
+            flag_can_be_renewed=flag(expiring_soon | Q(end__lt=today)),
+        )
+
     def expiring_payouts(self):
-        now = timezone.now()
-        limit_date = now + relativedelta(days=settings.ENDING_CONTRACT_WARNING_N_DAYS_BEFORE)
+        """
+        Contracts with days without payouts in the next
+        ENDING_CONTRACT_WARNING_N_DAYS_BEFORE days.
+        """
+        return self.with_payout_gaps()
 
-        # exclude all the contracts with payouts with ending at the end of the contract
-        qs = self.exclude(payout__end__gte=F('end'))
+    def payout_gaps(self, window=None, today=None):
+        """
+        Finds the days without payouts of the contracts in the window of
+        days starting today, by default ENDING_CONTRACT_WARNING_N_DAYS_BEFORE.
 
-        # filter all the contracts with payouts ending before the limit date
-        qs = qs.filter(payout__end__lte=limit_date)
-        return qs.distinct()
+        The payouts of all the contracts are fetched in a single query,
+        ordered by start, and swept once per contract. Returns a dict
+        mapping the pk of each contract with days without payouts to the
+        list of its uncovered (start, end) date ranges.
+        """
+        Payout = apps.get_model('humanresources', 'Payout')
+
+        if window is None:
+            window = settings.ENDING_CONTRACT_WARNING_N_DAYS_BEFORE
+        if today is None:
+            today = timezone.now().date()
+        window_end = today + timedelta(days=window - 1)
+
+        contracts = self.filter(start__lte=window_end, end__gte=today)
+
+        payouts = Payout.objects.filter(
+            Q(end__gte=today) | Q(end__isnull=True),
+            contract__in=contracts.values('pk'),
+            start__lte=window_end,
+        ).order_by('contract_id', 'start').values_list('contract_id', 'start', 'end')
+
+        intervals = {}
+        for contract_id, start, end in payouts:
+            intervals.setdefault(contract_id, []).append((start, end))
+
+        gaps = {}
+        for pk, start, end in contracts.order_by().values_list('pk', 'start', 'end').distinct():
+            ranges = uncovered_ranges(max(start, today), min(end, window_end), intervals.get(pk, []))
+            if ranges:
+                gaps[pk] = ranges
+        return gaps
+
+    def with_payout_gaps(self, window=None, today=None):
+        """
+        Filters the contracts with days without payouts, see `payout_gaps`.
+        """
+        return self.filter(pk__in=list(self.payout_gaps(window, today)))
 
     # User dependent Querysets
     # =========================================================================
@@ -62,7 +158,21 @@ class ContractQuerySet(models.QuerySet):
         Filters the Queryset to objects the user is allowed to manage
         given his Authorization Group profiles.
 
-        Uses the RankedPermissions table.
+        Uses the RankedPermissions table, through the per-user cache of
+        the people he can manage. The group memberships are checked
+        against the cached ones or, if the HUMANRESOURCES_MANAGED_BY_EXISTS
+        setting is enabled, with EXISTS subqueries.
+        """
+        if getattr(settings, 'HUMANRESOURCES_MANAGED_BY_EXISTS', False):
+            return self.managed_by_exists(user, required_codenames, default)
+        return self.managed_by_cached(user, required_codenames, default)
+
+    def managed_by_cached(self, user, required_codenames, default=None):
+        """
+        Implementation of `managed_by` filtering by the people ids and
+        the membership dates cached in the user visibility, so neither
+        the memberships joins nor a DISTINCT are needed. The scopes too
+        large for the IN lists fall back to `managed_by_exists`.
         """
 
         if default is None:
@@ -70,62 +180,71 @@ class ContractQuerySet(models.QuerySet):
 
         if user.is_superuser: return self
 
-        ranked_permissions = Permission.objects.filter_by_auth_permissions(
-            user, self.model, required_codenames)
+        visibility = get_visibility(user, self.model, required_codenames)
 
-        if ranked_permissions.exists():
-            # check if the user has permissions to all people
-            if ranked_permissions.filter(researchgroup=None).exists():
-                return self
-            else:
+        # check if the user has permissions to all people
+        if visibility['scope'] == SCOPE_ALL:
+            return self
 
-                # check which groups the user has to its people
-                groups_withaccess = [p.researchgroup for p in ranked_permissions]
-                rankings = [(p.researchgroup, p.ranking) for p in ranked_permissions]
+        if visibility['scope'] == SCOPE_GROUPS:
+            memberships = memberships_filter(visibility, 'start', 'end')
+            if memberships is None:
+                return self.managed_by_exists(user, required_codenames, default)
 
-                rankfilters = Q()
-                for researchgroup, ranking in rankings:
-                    rankfilters.add(Q(researchgroup=researchgroup, ranking__gte=ranking), Q.OR)
-                rankperms = Permission.objects.filter(rankfilters)
+            return self.filter(
+                # Show the contracts from the user
+                Q(person__auth_user=user) |
+                # Show the contracts the user is supervisor
+                Q(supervisor__auth_user=user) |
+                # Show the people from groups with visibility, during
+                # their memberships
+                memberships
+            )
 
-                persons = Person.objects.filter(group__in=groups_withaccess)
-                persons = persons.exclude(
-                    ~Q(auth_user=user) &
-                    Q(auth_user__groups__rankedpermissions__in=rankperms)
-                ).distinct()
+        return default
 
+    def managed_by_exists(self, user, required_codenames, default=None):
+        """
+        Implementation of `managed_by` checking the group memberships
+        with a correlated EXISTS subquery, so no DISTINCT is needed.
+        """
 
-                filters = Q()
+        if default is None:
+            default = self.none()
 
-                # Show the contracts from the user
-                filters.add(Q(person__auth_user=user), Q.OR)
+        if user.is_superuser: return self
 
-                # Show the contracts the user is supervisor
-                filters.add(Q(supervisor__auth_user=user), Q.OR)
+        visibility = get_visibility(user, self.model, required_codenames)
+
+        # check if the user has permissions to all people
+        if visibility['scope'] == SCOPE_ALL:
+            return self
+
+        if visibility['scope'] == SCOPE_GROUPS:
+            GroupMember = apps.get_model('people', 'GroupMember')
+
+            # The contract person was member of a group with visibility
+            memberships = GroupMember.objects.filter(
+                person=OuterRef('person'),
+                group__in=visibility['groups'],
+            ).filter(
+                Q(date_joined__lte=OuterRef('start'), date_left__gte=OuterRef('end')) |
+                Q(date_joined__lte=OuterRef('start'), date_left__isnull=True) |
+                Q(date_joined__isnull=True, date_left__isnull=True)
+            )
 
+            return self.annotate(
+                managed_membership=Exists(memberships)
+            ).filter(
+                # Show the contracts from the user
+                Q(person__auth_user=user) |
+                # Show the contracts the user is supervisor
+                Q(supervisor__auth_user=user) |
                 # Show the people from groups with visibility
-                filters.add(Q(
-                    person__groupmember__date_joined__lte=F('start'),
-                    person__groupmember__date_left__gte=F('end'),
-                    person__groupmember__group__in=groups_withaccess,
-                    person__in=persons
-                ), Q.OR)
-                filters.add(Q(
-                    person__groupmember__date_joined__lte=F('start'),
-                    person__groupmember__date_left__isnull=True,
-                    person__groupmember__group__in=groups_withaccess,
-                    person__in=persons
-                ), Q.OR)
-                filters.add(Q(
-                    person__groupmember__date_joined__isnull=True,
-                    person__groupmember__date_left__isnull=True,
-                    person__groupmember__group__in=groups_withaccess,
-                    person__in=persons
-                ), Q.OR)
-
-                return self.filter(filters).distinct()
-
-        return default.distinct()
+                Q(person_id__in=visibility['persons'], managed_membership=True)
+            )
+
+        return default
 
     # PyForms Querysets
     # =========================================================================
@@ -1,9 +1,10 @@
 import datetime
+from decimal import Decimal
 from dateutil.relativedelta import relativedelta
 
 from django.conf import settings
 from django.utils.html import format_html
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.contrib.auth.models import Group as AuthGroup
 
@@ -25,6 +26,45 @@ except:
 
 
 
+def prorated_amount(amount, start, end):
+    """
+    Returns the amount to pay between the start and end dates, both
+    inclusive, for the monthly amount: full months are paid by the
+    monthly amount and the remaining days at 1/30 of it.
+    """
+    diff = relativedelta(end + datetime.timedelta(1), start)
+    if amount==None: amount = 0.0
+    return float(diff.years)*12*float(amount)+float(diff.months)*float(amount)+float(diff.days)*(float(amount)/30)
+
+
+def monthly_amounts(amount, start, end):
+    """
+    Splits the total amount paid between the start and end dates by the
+    months they cover. Returns a list of (month, amount) tuples, where
+    month is the first day of the month.
+
+    Each month amount is the difference between the amounts accumulated
+    until the end of the month and until the end of the previous one,
+    so the months always add up to the total amount.
+    """
+    if start is None or end is None or end < start:
+        return []
+
+    amounts = []
+    accumulated = Decimal('0.00')
+    month = start.replace(day=1)
+    while month <= end:
+        month_end = month + relativedelta(months=1) - datetime.timedelta(1)
+        until = min(month_end, end)
+
+        value = Decimal(str(round(prorated_amount(amount, start, until), 2)))
+        amounts.append((month, value - accumulated))
+        accumulated = value
+
+        month = month_end + datetime.timedelta(1)
+
+    return amounts
+
 
 class Payout(models.Model):
     """
@@ -61,14 +101,48 @@ class Payout(models.Model):
         if self.end==None:
             return "Set the payout end"
 
-        payout_end = self.end + datetime.timedelta(1)
-        diff = relativedelta(payout_end, self.start)
-        amount = self.amount
-        if amount==None: amount = 0.0
-        return round(float(diff.years)*12*float(amount)+float(diff.months)*float(amount)+float(diff.days)*(float(amount)/30), 2)
+        return round(prorated_amount(self.amount, self.start, self.end), 2)
     total_amount.short_description = 'Total amount'
 
-    def update_order(self, user):
+    def monthly_amounts(self):
+        """
+        Splits the total amount of the payout by the months it covers,
+        see `monthly_amounts`.
+        """
+        return monthly_amounts(self.amount, self.start, self.end)
+
+    def update_ledger(self):
+        """
+        Rebuilds the monthly ledger rows of this payout.
+        """
+        from humanresources.models import PayoutMonth
+
+        # a failure must not leave the payout without its ledger rows
+        with transaction.atomic():
+            PayoutMonth.objects.filter(payout=self).delete()
+            PayoutMonth.objects.bulk_create(PayoutMonth.rows_for(self))
+
+    @staticmethod
+    def order_lookups():
+        """
+        Returns the reference objects used to create the payouts
+        orders. When creating many payouts, resolve them once and pass
+        them to `update_order`.
+        """
+        if not orders_module_installed:
+            return None
+
+        supplier, created = Supplier.objects.get_or_create(
+            supplier_name="Human resources"
+        )
+        return {
+            'supplier': supplier,
+            'currency': Currency.objects.get(currency_name=settings.DEFAULT_CURRENCY_NAME),
+            'group': AuthGroup.objects.get(name=settings.PROFILE_HUMAN_RESOURCES),
+            'expensecodes': {},
+        }
+
+    def update_order(self, user, lookups=None):
         """
         Because for every Payout a requisition is made, we automatically
         generate the associated Order using this method. This Order
@@ -89,23 +163,26 @@ class Payout(models.Model):
 
         elif self.order is None:
 
-            supplier, created = Supplier.objects.get_or_create(
-                supplier_name="Human resources"
-            )
+            if lookups is None:
+                lookups = self.order_lookups()
+
+            expensecode = lookups['expensecodes'].get(self.project_id)
+            if expensecode is None:
+                expensecode = ExpenseCode.objects.get(
+                    expensecode_number="01",
+                    project=self.project,
+                )
+                lookups['expensecodes'][self.project_id] = expensecode
 
-            expensecode = ExpenseCode.objects.get(
-                expensecode_number="01",
-                project=self.project,
-            )
             neworder = Order(
                 order_amount=self.total_amount(),
                 order_req=user.username,
                 responsible=user,
-                supplier=supplier,
-                currency=Currency.objects.get(currency_name=settings.DEFAULT_CURRENCY_NAME),
+                supplier=lookups['supplier'],
+                currency=lookups['currency'],
                 order_desc="%s's - contract" % self.contract.person,
                 order_reqdate=timezone.now(),
-                group=AuthGroup.objects.get(name=settings.PROFILE_HUMAN_RESOURCES),
+                group=lookups['group'],
             )
             neworder.save(expensecode_kwargs=dict(expensecode=expensecode))
             self.order = neworder
@@ -133,12 +210,15 @@ class Payout(models.Model):
     def save(self, *args, **kwargs):
 
         user = kwargs.pop('user')
+        lookups = kwargs.pop('order_lookups', None)
         if user is None:
             raise Exception(
                 'A User is required to create the Order associated with '
                 'this Payout'
             )
-        self.update_order(user)
+        self.update_order(user, lookups)
 
         self.total = self.total_amount()
         super(Payout, self).save(*args, **kwargs)
+
+        self.update_ledger()
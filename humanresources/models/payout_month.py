@@ -0,0 +1,38 @@
+from django.db import models
+
+
+class PayoutMonth(models.Model):
+    """
+    Monthly ledger of the payouts.
+
+    Each Payout is split into one row per month it covers, with the
+    prorated amount paid in that month. The rows are derived from the
+    Payout and rebuilt every time it is saved.
+    """
+
+    month  = models.DateField('Month')
+    amount = models.DecimalField('Amount', max_digits=15, decimal_places=2)
+    payout  = models.ForeignKey('Payout', verbose_name='Payout', on_delete=models.CASCADE)
+    project = models.ForeignKey('finance.Project', verbose_name='Finance Project', on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ['month', ]
+        verbose_name = "payout month"
+        verbose_name_plural = "payouts months"
+        indexes = [
+            models.Index(fields=['month', 'project'], name='payoutmonth_month_project_idx'),
+            models.Index(fields=['project', 'month'], name='payoutmonth_project_month_idx'),
+        ]
+
+    def __str__(self):
+        return '{0:%Y-%m}: {1}'.format(self.month, self.amount)
+
+    @classmethod
+    def rows_for(cls, payout):
+        """
+        Returns the unsaved ledger rows of the payout.
+        """
+        return [
+            cls(payout=payout, project_id=payout.project_id, month=month, amount=amount)
+            for month, amount in payout.monthly_amounts()
+        ]
@@ -1,5 +1,3 @@
-import tempfile
-import weasyprint
 from datetime import date
 from datetime import timedelta
 
@@ -8,15 +6,19 @@ from django.apps import apps
 from django.utils.html import format_html
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
-from django.contrib.auth.models import Group, User
-from django.db import models
+from django.contrib.auth.models import User
+from django.db import models, transaction
 from django.template.loader import render_to_string
 from django.core.exceptions import ValidationError
 from django.core.exceptions import FieldError
 from django.contrib.sites.shortcuts import get_current_site
 from django.shortcuts import render
-from django_weasyprint import WeasyTemplateView
-from humanresources.utils import send_mail
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from humanresources import pdf_cache
+from humanresources.rendering import html_to_pdf
+from humanresources.utils import queue_mail
 from model_utils.models import StatusModel
 from model_utils import Choices
 from django.urls import reverse
@@ -41,12 +43,20 @@ class ContractProposal(StatusModel):
         ('rejected', 'Rejected'),
     )
 
+    #: Proposals in these status can no longer be changed or removed
+    LOCKED_STATUS = ('submitted', 'approved', 'rejected')
+
+    #: Proposals in these status can be approved
+    APPROVABLE_STATUS = ('pending', 'printed', 'submitted')
+
     MOTIVES = Choices(
         ('new', 'New Hire'),
         ('renewal', 'Renewal'),
         ('update', 'Update'),
     )
 
+    PDF_TEMPLATE = 'pdfs/contract_proposal_pdf_template.html'
+
     motive = models.CharField(
         choices=MOTIVES,
         default=MOTIVES.new,
@@ -62,6 +72,7 @@ class ContractProposal(StatusModel):
     start           = models.DateField('Start date')  #: Start date of the function and affiliation
     months_duration = models.IntegerField('Duration', help_text='Months')
     days_duration   = models.IntegerField('Days', help_text='Additional days', default=0)
+    end             = models.DateField('End date', blank=True, null=True, db_index=True)
     description     = models.TextField('Scientific Work Description', blank=False, null=False, default='', help_text="Short mandatory description")
 
     person          = models.ForeignKey('people.Person', blank=True, null=True, on_delete=models.CASCADE)
@@ -79,9 +90,13 @@ class ContractProposal(StatusModel):
     objects = ProposalQuerySet.as_manager()
 
     class Meta:
-        ordering = ['-created_on',]
+        ordering = ['-created_on', 'id']
         verbose_name = "Contract proposal"
         verbose_name_plural = "Contract proposals"
+        indexes = [
+            # keyset pagination of the proposals list
+            models.Index(fields=['-created_on', 'id'], name='proposal_created_id_idx'),
+        ]
 
 
         permissions = (
@@ -116,8 +131,8 @@ class ContractProposal(StatusModel):
 
     def save(self, sendemail=False, *args, **kwargs):
         """
-        Override the save method to send an email when a new Proposal
-        is created.
+        Override the save method to queue an email when a new Proposal
+        is created. The email is queued in the same transaction.
         """
         if not self.responsible:
             raise ValidationError('This proposal has no person responsible')
@@ -125,28 +140,23 @@ class ContractProposal(StatusModel):
         if self._state.adding:  # a new proposal is being created
             sendemail = True
 
-        super().save(*args, **kwargs)
+        self.end = self.end_date()
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
-        if sendemail:
-            self.send_notification_mail()
+            if sendemail:
+                self.send_notification_mail()
 
     def send_notification_mail(self):
-        """Send an email to every user in auth group 'PROFILE: Human resources'
-        notifying about this proposal.
+        """Queue an email to every user in auth group 'PROFILE: Human resources'
+        notifying about this proposal. The email is delivered by the
+        `send_queued_emails` command.
 
         Notifications supported:
             - New
             - Updated # TODO need subject change
         """
-        try:
-            group = Group.objects.get(name=settings.PROFILE_HUMAN_RESOURCES)
-            users = group.user_set.all()
-            recipient_list = [
-                user.email for user in users if user.email
-            ]
-        except Group.DoesNotExist:
-            recipient_list = []
-
         # required because pyforms absolute URL includes BASE_URL, but admin doesn't
         if django.VERSION > (2, 0):
             proposal_url = self.get_absolute_url()
@@ -160,10 +170,14 @@ class ContractProposal(StatusModel):
 
         subject = 'New contract proposal'
 
-        send_mail(subject, recipient_list, message_context)
+        queue_mail(
+            subject,
+            recipient_group=settings.PROFILE_HUMAN_RESOURCES,
+            message_context=message_context,
+        )
 
     def is_locked(self):
-        return self.status in ('submitted', 'approved', 'rejected')
+        return self.status in self.LOCKED_STATUS
 
     def status_icon(self):
         d = {
@@ -189,15 +203,10 @@ class ContractProposal(StatusModel):
     contractproposal_status.short_description = 'Contract Proposal Status'
     contractproposal_status.allow_tags = True
 
-    def print2pdf(self):
-        template = 'humanresources/contract_proposal_pdf_template.html'
-        html = render_to_string(template, {'proposal': self})
-
-        filename = tempfile.mktemp()
-        with open(filename, "w") as outfile:
-            outfile.write(html)
-
-        return weasyprint.HTML(filename).write_pdf()
+    def print2pdf(self, base_url=None):
+        """Renders the proposal PDF in memory and returns its bytes."""
+        html = render_to_string(self.PDF_TEMPLATE, self.pdf_context())
+        return html_to_pdf(html, base_url=base_url)
 
     # DJANGO 1.6 (Deprecated) #######################
 
@@ -298,23 +307,13 @@ class ContractProposal(StatusModel):
     #     link = '<a href="{}" target="_blank" title="{}">{} print</a>'
     #     return format_html(link.format(url, help_text, icon))
 
-    def generate_contract(self, **kwargs):
+    def build_contract(self):
         """
-        Create a Contract based on an approved Proposal.
+        Returns the unsaved Contract based on this Proposal.
         """
-
         Contract = apps.get_model('humanresources', 'Contract')
-        Payout   = apps.get_model('humanresources', 'Payout')
 
-        if self.status != 'approved':
-            raise ValidationError(
-                "Proposal needs to be approved in order to originate a"
-                " contract."
-            )
-        if self.contract:
-            raise FieldError("A Contract for this proposal already exists")
-
-        new_contract = Contract(
+        return Contract(
             person=self.person,
             start=self.start,
             months_duration=self.months_duration,
@@ -324,8 +323,15 @@ class ContractProposal(StatusModel):
             fellowship_type=self.fellowship_type,
             position=self.position,
         )
-        new_contract.save()
 
+    def build_payouts(self, contract):
+        """
+        Returns the unsaved Payouts of the contract, one for each payment
+        of this Proposal.
+        """
+        Payout = apps.get_model('humanresources', 'Payout')
+
+        payouts = []
         for payment in self.payment_set.all():
             # request by Teresa:
             # Payout end date should not fall beyond end of the current year
@@ -334,13 +340,37 @@ class ContractProposal(StatusModel):
             if proposal_end.year > proposal_start.year:
                 proposal_end = date(proposal_start.year, 12, 31)
 
-            payout = Payout(
-                contract=new_contract,
+            payouts.append(Payout(
+                contract=contract,
                 project=payment.project,
                 amount=payment.amount,
                 start=proposal_start,
                 end=proposal_end,
+            ))
+        return payouts
+
+    def is_approvable(self):
+        return self.status in self.APPROVABLE_STATUS and not self.contract_id and not self.closed_on
+
+    def validate_contract_generation(self):
+        if self.status != 'approved':
+            raise ValidationError(
+                "Proposal needs to be approved in order to originate a"
+                " contract."
             )
+        if self.contract:
+            raise FieldError("A Contract for this proposal already exists")
+
+    def generate_contract(self, **kwargs):
+        """
+        Create a Contract based on an approved Proposal.
+        """
+        self.validate_contract_generation()
+
+        new_contract = self.build_contract()
+        new_contract.save()
+
+        for payout in self.build_payouts(new_contract):
             payout.save(user=kwargs.get('user', None))
 
         self.contract = new_contract
@@ -348,12 +378,8 @@ class ContractProposal(StatusModel):
 
         return new_contract
 
-    def generate_pdf_view(self, request=None):
-        """Returns a PDF view for this proposal."""
-
-        template = 'pdfs/contract_proposal_pdf_template.html'
-
-        context = {
+    def pdf_context(self):
+        return {
             'proposal': self,
 
             # FIXME test only
@@ -361,15 +387,33 @@ class ContractProposal(StatusModel):
             'proposal_date': self.created_on.strftime('%b %d, %Y'),
         }
 
-        # FIXME this should be the debug, erase the `not`
-        if 'debug' not in request.GET:
+    def generate_pdf_view(self, request=None):
+        """Returns a PDF view for this proposal.
+
+        The PDF is served from the cache when the proposal did not change
+        since it was last printed, and its digest is used as the ETag.
+        """
+
+        if 'debug' in request.GET:
             return render(
                 request,
-                template_name=template,
-                context=context,
+                template_name=self.PDF_TEMPLATE,
+                context=self.pdf_context(),
+            )
+
+        digest = pdf_cache.proposal_digest(self, self.PDF_TEMPLATE)
+        etag = quote_etag(digest)
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            digest, pdf = pdf_cache.get_or_render(
+                self, self.PDF_TEMPLATE,
+                lambda: self.print2pdf(base_url=request.build_absolute_uri('/')),
+                digest=digest,
             )
+            response = HttpResponse(pdf, content_type='application/pdf')
+            response['Content-Disposition'] = 'inline; filename="proposal-{0}.pdf"'.format(self.pk)
 
-        return WeasyTemplateView.as_view(
-            template_name=template,
-            extra_context=context,
-        )(request)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -1,25 +1,19 @@
+from django.apps import apps
+from django.conf import settings
 from django.db import models
-from django.db.models import Q, F
+from django.db.models import Q, F, Exists, OuterRef
 from django.utils import timezone
 
 from people.models import Person
 from permissions.models import Permission
-from core_utils.models_functions import MonthsAdd, DaysAdd
+from humanresources.visibility import get_visibility, SCOPE_ALL, SCOPE_GROUPS
 
 
 class ProposalQuerySet(models.QuerySet):
 
     def active(self):
         now = timezone.now()
-        qs = self
-        qs = qs.annotate(proposal_end=DaysAdd(
-            MonthsAdd('contractproposal_start', models.F('contractproposal_duration')),
-            models.F('contractproposal_duration_additional_days')
-        ))
-        return qs.filter(
-            contractproposal_start__lte=now,
-            proposal_end__gte=now
-        )
+        return self.filter(start__lte=now, end__gte=now)
 
     def owned_by(self, user):
         """
@@ -31,16 +25,12 @@ class ProposalQuerySet(models.QuerySet):
         if user.is_superuser:
             return self
 
-        filter = self
-        try:
-            filter = filter.filter(
-                Q(person__auth_user=user) | Q(supervisor__in=user.person) | Q(responsible__user_auth=user)
-            )
-        except Person.DoesNotExist:
-            pass
+        filter = self.filter(
+            Q(person__auth_user=user) | Q(supervisor__auth_user=user) | Q(responsible__auth_user=user)
+        )
 
         return filter.exclude(
-            Q(person__auth_user=user) & ~Q(responsible__user_auth=user)
+            Q(person__auth_user=user) & ~Q(responsible__auth_user=user)
         ).distinct()
 
     def managed_by(self, user, required_codenames, default=None):
@@ -48,7 +38,18 @@ class ProposalQuerySet(models.QuerySet):
         Filters the Queryset to objects the user is allowed to manage
         given his Authorization Group profiles.
 
-        Uses the RankedPermissions table.
+        Uses the RankedPermissions table. The group memberships are
+        checked with joins or, if the HUMANRESOURCES_MANAGED_BY_EXISTS
+        setting is enabled, with EXISTS subqueries.
+        """
+        if getattr(settings, 'HUMANRESOURCES_MANAGED_BY_EXISTS', False):
+            return self.managed_by_exists(user, required_codenames, default)
+        return self.managed_by_joins(user, required_codenames, default)
+
+    def managed_by_joins(self, user, required_codenames, default=None):
+        """
+        Implementation of `managed_by` joining the group memberships,
+        which requires a DISTINCT.
         """
 
         if default is None:
@@ -88,7 +89,7 @@ class ProposalQuerySet(models.QuerySet):
                 filters.add(Q(person__auth_user=user), Q.OR)
 
                 # If the proposal was submitted by the user
-                filters.add(Q(responsible__user_auth=user), Q.OR)
+                filters.add(Q(responsible__auth_user=user), Q.OR)
 
                 # If the user is the supervisor
                 filters.add(Q(supervisor__auth_user=user), Q.OR)
@@ -122,11 +123,82 @@ class ProposalQuerySet(models.QuerySet):
 
                 # Finally, exclude self proposals
                 return self.filter(filters).exclude(
-                    Q(person__auth_user=user) & ~Q(responsible__user_auth=user)
+                    Q(person__auth_user=user) & ~Q(responsible__auth_user=user)
                 ).distinct()
 
         return default.distinct()
 
+    def managed_by_exists(self, user, required_codenames, default=None):
+        """
+        Implementation of `managed_by` checking the group memberships
+        with correlated EXISTS subqueries, so no DISTINCT is needed.
+
+        Uses the per-user cache of the people the user can manage.
+        """
+
+        if default is None:
+            default = self.none()
+
+        if user.is_superuser:
+            return self
+
+        visibility = get_visibility(user, self.model, required_codenames)
+
+        # check if the user has permissions to all people
+        if visibility['scope'] == SCOPE_ALL:
+            return self
+
+        if visibility['scope'] == SCOPE_GROUPS:
+            GroupMember = apps.get_model('people', 'GroupMember')
+
+            groups_withaccess = visibility['groups']
+            persons = visibility['persons']
+
+            # The proposal person was member of a group with visibility
+            memberships = GroupMember.objects.filter(
+                person=OuterRef('person'),
+                group__in=groups_withaccess,
+            ).filter(
+                Q(date_joined__lte=OuterRef('start'), date_left__gte=OuterRef('start')) |
+                Q(date_joined__lte=OuterRef('start'), date_left__isnull=True) |
+                Q(date_joined__isnull=True, date_left__isnull=True)
+            )
+
+            # The proposal supervisor is member of a group with visibility
+            supervisor_memberships = GroupMember.objects.filter(
+                person=OuterRef('supervisor'),
+                group__in=groups_withaccess,
+            )
+
+            qs = self.annotate(
+                managed_membership=Exists(memberships),
+                managed_supervisor=Exists(supervisor_memberships),
+            )
+
+            filters = Q()
+            # If the proposal is from the user
+            filters.add(Q(person__auth_user=user), Q.OR)
+
+            # If the proposal was submitted by the user
+            filters.add(Q(responsible__auth_user=user), Q.OR)
+
+            # If the user is the supervisor
+            filters.add(Q(supervisor__auth_user=user), Q.OR)
+
+            # Proposal supervisor is of a group managed by user and
+            # has no higher ranked permissions on it
+            filters.add(Q(managed_supervisor=True, supervisor_id__in=persons), Q.OR)
+
+            # Add the group users
+            filters.add(Q(managed_membership=True, person_id__in=persons), Q.OR)
+
+            # Finally, exclude self proposals
+            return qs.filter(filters).exclude(
+                Q(person__auth_user=user) & ~Q(responsible__auth_user=user)
+            )
+
+        return default
+
     # PyForms Querysets
     # =========================================================================
 
@@ -153,6 +225,18 @@ class ProposalQuerySet(models.QuerySet):
         # their own objects via list_permissions
         return self.list_permissions(user)
 
+    def _unlocked_exists(self, objects):
+        """
+        True if there are objects and none of them is locked.
+        """
+        if objects is None:
+            return False
+
+        if objects.filter(status__in=self.model.LOCKED_STATUS).exists():
+            return False
+
+        return objects.exists()
+
     def has_update_permissions(self, user):
         """Can only edit unlocked Proposals"""
         objects = self.managed_by(
@@ -161,14 +245,7 @@ class ProposalQuerySet(models.QuerySet):
             default=self.owned_by(user),
         )
 
-        if objects is None:
-            return False
-
-        for obj in objects:
-            if obj.is_locked():
-                return False
-
-        return objects.exists()
+        return self._unlocked_exists(objects)
 
     def has_remove_permissions(self, user):
         objects = self.managed_by(
@@ -177,14 +254,7 @@ class ProposalQuerySet(models.QuerySet):
             default=self.owned_by(user)
         )
 
-        if objects is None:
-            return False
-
-        for obj in objects:
-            if obj.is_locked():
-                return False
-
-        return objects.exists()
+        return self._unlocked_exists(objects)
 
     def has_print_permissions(self, user):
         return self.managed_by(
@@ -0,0 +1,41 @@
+from django.db import models
+
+
+class QueuedEmail(models.Model):
+    """
+    Outbox of the emails sent by the module.
+
+    The emails are queued in the same transaction as the objects they
+    notify about, and delivered later in batches by the
+    `send_queued_emails` command. The templates are rendered, and the
+    recipients of the auth group resolved, only when delivering.
+    """
+
+    STATUS = (
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
+    subject         = models.CharField('Subject', max_length=255)
+    context         = models.TextField('Message context', default='{}', help_text='JSON')
+    recipient_list  = models.TextField('Recipients', blank=True, default='', help_text='One email per line')
+    recipient_group = models.CharField('Recipients auth group', max_length=150, blank=True, default='')
+
+    status       = models.CharField('Status', max_length=7, choices=STATUS, default='pending')
+    attempts     = models.PositiveSmallIntegerField('Attempts', default=0)
+    next_attempt = models.DateTimeField('Next attempt', auto_now_add=True)
+    last_error   = models.TextField('Last error', blank=True, default='')
+    created_on   = models.DateTimeField('Created on', auto_now_add=True)
+    sent_on      = models.DateTimeField('Sent on', blank=True, null=True)
+
+    class Meta:
+        ordering = ['next_attempt', ]
+        verbose_name = "queued email"
+        verbose_name_plural = "queued emails"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt'], name='queuedemail_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return '{0} ({1})'.format(self.subject, self.status)
@@ -0,0 +1,25 @@
+from django.db import models
+
+
+class SearchToken(models.Model):
+    """
+    Word of the searchable text of a contract or proposal, normalized
+    without accents or case. See `humanresources.search`.
+    """
+
+    model     = models.CharField('Model', max_length=100)
+    object_id = models.PositiveIntegerField('Object id')
+    token     = models.CharField('Token', max_length=100)
+
+    class Meta:
+        verbose_name = "search token"
+        verbose_name_plural = "search tokens"
+        indexes = [
+            # word prefix searches
+            models.Index(fields=['model', 'token', 'object_id'], name='searchtoken_token_idx'),
+            # updates of the tokens of an object
+            models.Index(fields=['model', 'object_id'], name='searchtoken_object_idx'),
+        ]
+
+    def __str__(self):
+        return self.token
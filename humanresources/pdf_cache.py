@@ -0,0 +1,150 @@
+"""
+Content addressed cache of the proposals PDFs.
+
+Each PDF is stored on disk under the digest of everything it is
+rendered from: the proposal fields, its payments and the template
+modification time. A changed proposal gets a new digest, so the
+entries never need to be invalidated, and the least recently used
+ones are evicted when the cache grows above its maximum size.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.template.loader import get_template
+
+
+#: bump to discard the cached PDFs after changing how they are rendered
+VERSION = 1
+
+
+def get_cache_dir():
+    return getattr(
+        settings, 'HUMANRESOURCES_PDF_CACHE_DIR',
+        os.path.join(tempfile.gettempdir(), 'humanresources-pdfs')
+    )
+
+
+def get_max_size():
+    return getattr(settings, 'HUMANRESOURCES_PDF_CACHE_MAX_SIZE', 200 * 1024 * 1024)
+
+
+def template_mtime(template_name):
+    origin = get_template(template_name).origin
+    try:
+        return os.path.getmtime(origin.name)
+    except (OSError, TypeError):
+        return None
+
+
+def proposal_digest(proposal, template_name):
+    """
+    Returns the hex digest of the proposal fields, of the names of its
+    related objects, of its payments and of the template mtime.
+    """
+    parts = [VERSION, template_name, template_mtime(template_name)]
+
+    for field in proposal._meta.concrete_fields:
+        parts.append((field.attname, getattr(proposal, field.attname)))
+
+    parts.extend(
+        str(related) for related in (
+            proposal.person, proposal.supervisor, proposal.position, proposal.fellowship_type
+        )
+    )
+
+    # all() uses the payments prefetched by the caller
+    for payment in sorted(proposal.payment_set.all(), key=lambda payment: payment.pk):
+        parts.append((payment.pk, payment.amount, payment.n_months, payment.project_id, str(payment.project)))
+
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _path(digest):
+    return os.path.join(get_cache_dir(), digest + '.pdf')
+
+
+def get(digest):
+    """
+    Returns the cached PDF bytes, or None if they are not cached.
+    """
+    path = _path(digest)
+    try:
+        with open(path, 'rb') as infile:
+            data = infile.read()
+    except OSError:
+        return None
+
+    # the modification time tracks the last use, for the LRU eviction
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return data
+
+
+def put(digest, data):
+    """
+    Stores the PDF bytes and evicts the least recently used entries.
+    """
+    cache_dir = get_cache_dir()
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+
+    # write to a temporary file and rename it, so readers never see a
+    # partial PDF
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as outfile:
+            outfile.write(data)
+        os.replace(tmp_path, _path(digest))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    evict(get_max_size())
+
+
+def evict(max_size):
+    """
+    Removes the least recently used PDFs until the cache fits in max_size bytes.
+    """
+    entries = []
+    total = 0
+    try:
+        with os.scandir(get_cache_dir()) as it:
+            for entry in it:
+                if not entry.name.endswith('.pdf'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+    except OSError:
+        return
+
+    entries.sort()
+    for mtime, size, path in entries:
+        if total <= max_size:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        total -= size
+
+
+def get_or_render(proposal, template_name, render, digest=None):
+    """
+    Returns a (digest, pdf) tuple, calling render() to generate the PDF
+    bytes when they are not cached.
+    """
+    if digest is None:
+        digest = proposal_digest(proposal, template_name)
+    data = get(digest)
+    if data is None:
+        data = render()
+        put(digest, data)
+    return digest, data
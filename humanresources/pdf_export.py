@@ -0,0 +1,290 @@
+"""
+Batch export of proposals to PDF.
+
+The HTML of every proposal is rendered in the calling process, which
+is the only one accessing the database, and laid out to PDF in memory
+by a pool of worker processes, or in the calling process itself with
+`workers=0`. The PDFs already in the `pdf_cache` are not rendered
+again. The documents are returned in a zip archive or, if pypdf or
+PyPDF2 is installed, merged in a single PDF.
+
+The exports requested from the web are run by the export_proposals_pdf
+command in a background process, see `start_export`, and downloaded
+once the file is written.
+"""
+import io
+import json
+import math
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from django.utils.text import slugify
+
+from humanresources import pdf_cache
+from humanresources.models import ContractProposal, Payment
+from humanresources.rendering import html_to_pdf, get_pdf_merger
+
+
+FORMAT_ZIP = 'zip'
+FORMAT_PDF = 'pdf'
+
+
+class DocumentTimeout(Exception):
+    pass
+
+
+def _timeout_handler(signum, frame):
+    raise DocumentTimeout()
+
+
+def render_pdf(html, base_url=None, timeout=None):
+    """
+    Lays out the HTML to PDF bytes. The timeout is enforced with an
+    alarm signal where it is available, only in the main thread.
+    """
+    use_alarm = (
+        timeout and hasattr(signal, 'SIGALRM') and
+        threading.current_thread() is threading.main_thread()
+    )
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _timeout_handler)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return html_to_pdf(html, base_url=base_url)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+def document_name(proposal):
+    return 'proposal-{0}-{1}.pdf'.format(proposal.pk, slugify(str(proposal)))
+
+
+def export_proposals(proposals, output=FORMAT_ZIP, workers=None, timeout=60, base_url=None):
+    """
+    Renders the proposals to PDF in parallel, or sequentially in the
+    calling process if `workers` is 0.
+
+    Returns a (data, stats) tuple, with the bytes of the zip archive or
+    merged PDF and a dict with the number of `documents`, `cached` and
+    `failed` ones, the list of `errors` and the `elapsed` seconds.
+    """
+    merger = get_pdf_merger() if output == FORMAT_PDF else None
+    if output == FORMAT_PDF and merger is None:
+        raise ValueError('pypdf or PyPDF2 is required to merge the proposals in a single PDF')
+
+    t0 = time.perf_counter()
+    template = ContractProposal.PDF_TEMPLATE
+
+    proposals = list(
+        proposals.select_related(
+            'person', 'supervisor', 'position', 'fellowship_type'
+        ).prefetch_related(
+            Prefetch('payment_set', queryset=Payment.objects.select_related('project'))
+        ).order_by('pk')
+    )
+
+    pdfs = [None] * len(proposals)
+    errors = []
+    cached = 0
+
+    pending = []
+    for i, proposal in enumerate(proposals):
+        digest = pdf_cache.proposal_digest(proposal, template)
+        data = pdf_cache.get(digest)
+        if data is None:
+            html = render_to_string(template, proposal.pdf_context())
+            pending.append((i, digest, html))
+        else:
+            pdfs[i] = data
+            cached += 1
+
+    if pending and workers == 0:
+        for i, digest, html in pending:
+            try:
+                pdfs[i] = render_pdf(html, base_url, timeout)
+            except DocumentTimeout:
+                errors.append((proposals[i], 'Timed out after {0}s'.format(timeout)))
+            except Exception as e:
+                errors.append((proposals[i], '{0}: {1}'.format(type(e).__name__, e)))
+            else:
+                pdf_cache.put(digest, pdfs[i])
+
+    elif pending:
+        # the workers do not use the database, but would inherit the
+        # parent connections when forked
+        connections.close_all()
+
+        workers = workers or os.cpu_count() or 1
+        executor = ProcessPoolExecutor(max_workers=workers)
+        futures = [
+            (i, digest, executor.submit(render_pdf, html, base_url, timeout))
+            for i, digest, html in pending
+        ]
+
+        # the alarm may not stop a worker stuck outside of python code:
+        # give up on the documents not done once every round should be
+        deadline = None
+        if timeout:
+            deadline = time.monotonic() + timeout * (math.ceil(len(pending) / workers) + 1)
+
+        timed_out = False
+        for i, digest, future in futures:
+            try:
+                wait = None if deadline is None else max(0, deadline - time.monotonic())
+                pdfs[i] = future.result(timeout=wait)
+            except (DocumentTimeout, TimeoutError):
+                if not future.done():
+                    timed_out = True
+                    future.cancel()
+                errors.append((proposals[i], 'Timed out after {0}s'.format(timeout)))
+            except Exception as e:
+                errors.append((proposals[i], '{0}: {1}'.format(type(e).__name__, e)))
+            else:
+                pdf_cache.put(digest, pdfs[i])
+
+        # do not wait for the workers still stuck
+        executor.shutdown(wait=not timed_out)
+
+    documents = [(proposal, data) for proposal, data in zip(proposals, pdfs) if data is not None]
+
+    buffer = io.BytesIO()
+    if output == FORMAT_PDF:
+        for proposal, data in documents:
+            merger.append(io.BytesIO(data))
+        merger.write(buffer)
+        merger.close()
+    else:
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for proposal, data in documents:
+                archive.writestr(document_name(proposal), data)
+
+    stats = {
+        'documents': len(documents),
+        'cached':    cached,
+        'failed':    len(errors),
+        'errors':    errors,
+        'elapsed':   time.perf_counter() - t0,
+    }
+    return buffer.getvalue(), stats
+
+
+# Background exports
+# =============================================================================
+
+# runs the command in a fresh interpreter and records why it failed
+EXPORT_SNIPPET = """
+import sys, traceback
+import django
+django.setup()
+from django.core.management import call_command
+try:
+    call_command('export_proposals_pdf', *sys.argv[2:])
+except BaseException as e:
+    with open(sys.argv[1], 'w') as failed:
+        failed.write('{0}: {1}'.format(type(e).__name__, e))
+    raise
+"""
+
+
+def get_export_dir():
+    return getattr(
+        settings, 'HUMANRESOURCES_PDF_EXPORT_DIR',
+        os.path.join(tempfile.gettempdir(), 'humanresources-exports')
+    )
+
+
+def get_export_max_age():
+    return getattr(settings, 'HUMANRESOURCES_PDF_EXPORT_MAX_AGE', 24 * 3600)
+
+
+def export_path(token, extension):
+    return os.path.join(get_export_dir(), '{0}.{1}'.format(token, extension))
+
+
+def remove_old_exports():
+    """
+    Removes the files of the exports older than HUMANRESOURCES_PDF_EXPORT_MAX_AGE.
+    """
+    limit = time.time() - get_export_max_age()
+    for entry in os.scandir(get_export_dir()):
+        try:
+            if entry.stat().st_mtime < limit:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def start_export(user, proposal_ids, output=FORMAT_ZIP, timeout=60, base_url=None):
+    """
+    Starts the export of the proposals by the export_proposals_pdf
+    command in a background process, and returns the token of the
+    export, see `get_export`.
+    """
+    os.makedirs(get_export_dir(), exist_ok=True)
+    remove_old_exports()
+
+    token = uuid.uuid4().hex
+    with open(export_path(token, 'json'), 'w') as outfile:
+        json.dump({'user': user.pk, 'output': output, 'documents': len(proposal_ids)}, outfile)
+
+    args = [export_path(token, output), '--format', output, '--timeout', str(timeout)]
+    if base_url:
+        args += ['--base-url', base_url]
+    args += ['--ids'] + [str(pk) for pk in proposal_ids]
+
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE,
+        PYTHONPATH=os.pathsep.join(sys.path),
+    )
+    with open(export_path(token, 'log'), 'w') as log:
+        subprocess.Popen(
+            [sys.executable, '-c', EXPORT_SNIPPET, export_path(token, 'failed')] + args,
+            stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, env=env,
+            start_new_session=True,
+        )
+    return token
+
+
+def get_export(token, user):
+    """
+    Returns the dict describing the export of the user: its `output`
+    format, number of `documents`, the `path` of the file, once it is
+    written, and the `error` if it failed. Returns None if there is no
+    such export.
+    """
+    try:
+        with open(export_path(token, 'json')) as infile:
+            export = json.load(infile)
+    except (OSError, ValueError):
+        return None
+
+    if export['user'] != user.pk:
+        return None
+
+    path = export_path(token, export['output'])
+    export['path'] = path if os.path.exists(path) else None
+
+    export['error'] = None
+    try:
+        with open(export_path(token, 'failed')) as infile:
+            export['error'] = infile.read()
+    except OSError:
+        pass
+
+    return export
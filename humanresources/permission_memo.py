@@ -0,0 +1,105 @@
+"""
+Request scoped memo of permission checks. A single form render asks
+for the same permissions several times (buttons, inlines, readonly
+fields), so each distinct check, identified by the user, model,
+codenames and object pk, is evaluated only once per request.
+
+The memo is attached to the request stored by `PyFormsMiddleware`.
+Outside of a request, e.g. in management commands, the checks are
+always evaluated.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+ATTRIBUTE = '_humanresources_permission_memo'
+
+
+class PermissionMemo(object):
+
+    def __init__(self):
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, check):
+        try:
+            result = self.results[key]
+        except KeyError:
+            self.misses += 1
+            result = self.results[key] = check()
+        else:
+            self.hits += 1
+        return result
+
+    def clear(self):
+        self.results.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.results)}
+
+
+def get_request():
+    # imported here so the models and signals do not load pyforms
+    from pyforms_web.web.middleware import PyFormsMiddleware
+    return PyFormsMiddleware.get_request()
+
+
+def get_memo(request=None):
+    """
+    Returns the memo of the request, or of the current request if
+    none is given. Returns None outside of a request.
+    """
+    if request is None:
+        request = get_request()
+    if request is None:
+        return None
+
+    memo = getattr(request, ATTRIBUTE, None)
+    if memo is None:
+        memo = PermissionMemo()
+        setattr(request, ATTRIBUTE, memo)
+    return memo
+
+
+def memoize(user, model, codenames, pk, check):
+    """
+    Returns the result of calling `check`, evaluated once per request
+    for the same user, model, codenames and object pk.
+    """
+    memo = get_memo()
+    if memo is None:
+        return check()
+
+    key = (user.pk, model._meta.label_lower, tuple(sorted(codenames)), pk)
+    return memo.get(key, check)
+
+
+def clear():
+    """
+    Forgets the checks of the current request, called when objects
+    that affect the permissions are saved.
+    """
+    memo = get_memo()
+    if memo is not None:
+        memo.clear()
+
+
+class PermissionMemoMiddleware(object):
+    """
+    Logs the memo counters of each request at debug level.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        memo = getattr(request, ATTRIBUTE, None)
+        if memo is not None:
+            logger.debug(
+                "permission memo %s: %d hits, %d misses",
+                request.path, memo.hits, memo.misses,
+            )
+        return response
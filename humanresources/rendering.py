@@ -0,0 +1,42 @@
+"""
+Rendering of HTML documents to PDF.
+
+WeasyPrint and its cairo and fonts stack are slow to import, so they are
+loaded on the first document rendered instead of with the models.
+"""
+
+#: modules only imported when a document is rendered
+LAZY_MODULES = ('weasyprint', 'django_weasyprint', 'cairocffi', 'pypdf', 'PyPDF2')
+
+
+def html_to_pdf(html, base_url=None):
+    """
+    Lays out the HTML string to PDF and returns its bytes.
+    """
+    import weasyprint
+
+    return weasyprint.HTML(string=html, base_url=base_url).write_pdf()
+
+
+def get_pdf_merger():
+    """
+    Returns a new PDF merger, a pypdf PdfWriter or, with older installs,
+    a PyPDF2 PdfMerger, or None if neither is installed. They all offer
+    the append(), write() and close() methods.
+    """
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        pass
+    else:
+        return PdfWriter()
+
+    try:
+        # PdfFileMerger raises a DeprecationError since PyPDF2 3.0
+        from PyPDF2 import PdfMerger
+    except ImportError:
+        try:
+            from PyPDF2 import PdfFileMerger as PdfMerger
+        except ImportError:
+            return None
+    return PdfMerger()
@@ -0,0 +1,126 @@
+"""
+Search index of the contracts and proposals lists.
+
+The searchable text of each object, the names of its person and its
+reference, is stored as accent and case folded words in the
+`SearchToken` table, so the lists search by word prefix on an index
+instead of scanning joined tables with `LIKE '%...%'`. The index is
+updated by the signals in `signals.py` and can be rebuilt with the
+`rebuild_search_index` command.
+"""
+import re
+import unicodedata
+
+from django.apps import apps
+from django.db import transaction
+
+
+#: Fields with the searchable text of each indexed model
+SEARCH_FIELDS = {
+    'humanresources.contract': (
+        'person__full_name',
+        'ref',
+    ),
+    'humanresources.contractproposal': (
+        'person__first_name',
+        'person__last_name',
+        'person__full_name',
+        'person_name',
+    ),
+}
+
+MAX_TOKEN_LENGTH = 100
+
+
+def normalize(text):
+    """
+    Returns the text without accents, case or repeated spaces.
+    """
+    if text is None:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.casefold().split())
+
+
+def tokenize(text):
+    """
+    Returns the set of normalized words of the text.
+    """
+    return {word[:MAX_TOKEN_LENGTH] for word in re.findall(r'\w+', normalize(text))}
+
+
+def is_indexed(model):
+    return model._meta.label_lower in SEARCH_FIELDS
+
+
+def get_token_model():
+    return apps.get_model('humanresources', 'SearchToken')
+
+
+def update_index(model, pks, token_model=None):
+    """
+    Replaces the tokens of the objects with the pks. The token model
+    can be given to use the function in migrations.
+    """
+    if token_model is None:
+        token_model = get_token_model()
+
+    label = model._meta.label_lower
+    pks = list(pks)
+
+    tokens = []
+    rows = model._base_manager.filter(pk__in=pks).values_list('pk', *SEARCH_FIELDS[label])
+    for pk, *values in rows:
+        words = set()
+        for value in values:
+            words |= tokenize(value)
+        tokens += [token_model(model=label, object_id=pk, token=word) for word in sorted(words)]
+
+    with transaction.atomic():
+        token_model.objects.filter(model=label, object_id__in=pks).delete()
+        token_model.objects.bulk_create(tokens, batch_size=1000)
+
+
+def remove_from_index(model, pks):
+    get_token_model().objects.filter(model=model._meta.label_lower, object_id__in=list(pks)).delete()
+
+
+def update_person(person_id):
+    """
+    Updates the tokens of the contracts and proposals of a person,
+    after the person names change.
+    """
+    for label in SEARCH_FIELDS:
+        model = apps.get_model(label)
+        update_index(model, model._base_manager.filter(person=person_id).values_list('pk', flat=True))
+
+
+def rebuild_index(model, chunk_size=1000, token_model=None):
+    """
+    Rebuilds the tokens of every object of the model. Returns the
+    number of objects indexed.
+    """
+    if token_model is None:
+        token_model = get_token_model()
+
+    label = model._meta.label_lower
+    token_model.objects.filter(model=label).delete()
+
+    pks = list(model._base_manager.order_by('pk').values_list('pk', flat=True))
+    for i in range(0, len(pks), chunk_size):
+        update_index(model, pks[i:i + chunk_size], token_model)
+    return len(pks)
+
+
+def search(queryset, keywords):
+    """
+    Filters the objects with words starting with every keyword.
+    """
+    label = queryset.model._meta.label_lower
+    tokens = get_token_model().objects.filter(model=label)
+
+    for word in tokenize(keywords):
+        matches = tokens.filter(token__startswith=word).values('object_id')
+        queryset = queryset.filter(pk__in=matches)
+    return queryset
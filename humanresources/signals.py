@@ -0,0 +1,59 @@
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from . import expiring_contracts, permission_memo, search, visibility
+
+
+def invalidate_visibility(sender, **kwargs):
+    visibility.invalidate()
+
+
+# Changes that affect which people each user can manage
+for model in ('people.GroupMember', 'people.Person', 'permissions.Permission'):
+    post_save.connect(invalidate_visibility, sender=model, dispatch_uid=f'visibility_save_{model}')
+    post_delete.connect(invalidate_visibility, sender=model, dispatch_uid=f'visibility_delete_{model}')
+
+m2m_changed.connect(invalidate_visibility, sender=User.groups.through, dispatch_uid='visibility_user_groups')
+m2m_changed.connect(invalidate_visibility, sender=Group.permissions.through, dispatch_uid='visibility_group_permissions')
+
+
+def invalidate_expiring_contracts(sender, **kwargs):
+    expiring_contracts.invalidate()
+
+
+# Changes that affect the contracts listed in the dashboard
+for model in ('humanresources.Contract', 'people.GroupMember'):
+    post_save.connect(invalidate_expiring_contracts, sender=model, dispatch_uid=f'expiring_save_{model}')
+    post_delete.connect(invalidate_expiring_contracts, sender=model, dispatch_uid=f'expiring_delete_{model}')
+
+
+def clear_permission_memo(sender, **kwargs):
+    permission_memo.clear()
+
+
+# Changes that affect the permission checks memoized in the current request,
+# e.g. a proposal that becomes locked when submitted
+for model in ('humanresources.ContractProposal', 'humanresources.Payment',
+              'people.GroupMember', 'permissions.Permission'):
+    post_save.connect(clear_permission_memo, sender=model, dispatch_uid=f'memo_save_{model}')
+    post_delete.connect(clear_permission_memo, sender=model, dispatch_uid=f'memo_delete_{model}')
+
+
+def update_search_index(sender, instance, **kwargs):
+    search.update_index(sender, [instance.pk])
+
+
+def remove_from_search_index(sender, instance, **kwargs):
+    search.remove_from_index(sender, [instance.pk])
+
+
+def update_person_search_index(sender, instance, **kwargs):
+    search.update_person(instance.pk)
+
+
+# Changes to the searchable text of the contracts and proposals
+for model in ('humanresources.Contract', 'humanresources.ContractProposal'):
+    post_save.connect(update_search_index, sender=model, dispatch_uid=f'search_save_{model}')
+    post_delete.connect(remove_from_search_index, sender=model, dispatch_uid=f'search_delete_{model}')
+
+post_save.connect(update_person_search_index, sender='people.Person', dispatch_uid='search_save_people.Person')
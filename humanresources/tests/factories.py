@@ -0,0 +1,124 @@
+"""
+Generated people, memberships, contracts and proposals for the tests.
+"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.apps import apps
+from django.contrib.auth.models import Group as AuthGroup, Permission as AuthPermission, User
+from django.contrib.contenttypes.models import ContentType
+
+from humanresources.models import Contract, ContractProposal
+from people.models import Group, GroupType, Person
+from permissions.models import Permission
+
+
+CONTRACT_CODENAMES = ['view_contract', 'change_contract', 'delete_contract']
+PROPOSAL_CODENAMES = [
+    'view_contractproposal', 'change_contractproposal', 'delete_contractproposal',
+    'print_proposal', 'can_approve_contract_proposal',
+]
+
+
+def random_date(rng, first=date(2010, 1, 1), n_days=12 * 365):
+    return first + timedelta(days=rng.randrange(n_days))
+
+
+def create_person(i, user=None):
+    return Person.objects.create(
+        first_name='First%d' % i,
+        last_name='Last%d' % i,
+        full_name='First%d Last%d' % (i, i),
+        email='person%d@example.com' % i,
+        gender='F',
+        auth_user=user,
+    )
+
+
+def create_auth_group(name):
+    group = AuthGroup.objects.create(name=name)
+    group.permissions.set(AuthPermission.objects.filter(
+        content_type__in=[
+            ContentType.objects.get_for_model(Contract),
+            ContentType.objects.get_for_model(ContractProposal),
+        ],
+        codename__in=CONTRACT_CODENAMES + PROPOSAL_CODENAMES,
+    ))
+    return group
+
+
+def generate_data(n_people=40, seed=0):
+    """
+    Creates research groups with random memberships, contracts and
+    proposals, and returns the users of each permissions profile:
+    `hr` can manage everyone, `manager` the people of two groups,
+    `head` the people of one group with a higher ranking, and `member`
+    has no ranked permissions.
+    """
+    rng = random.Random(seed)
+    GroupMember = apps.get_model('people', 'GroupMember')
+
+    group_type = GroupType.objects.create(name='Lab')
+    groups = [
+        Group.objects.create(type=group_type, name='Group %d' % i, subject='Subject %d' % i)
+        for i in range(3)
+    ]
+
+    users = {}
+    for name in ('hr', 'manager', 'head', 'member'):
+        users[name] = User.objects.create_user(username=name, password=name)
+
+    hr = create_auth_group('HR')
+    manager = create_auth_group('Managers')
+    head = create_auth_group('Heads')
+    users['hr'].groups.add(hr)
+    users['manager'].groups.add(manager)
+    users['head'].groups.add(head)
+
+    Permission.objects.create(auth_group=hr, researchgroup=None, ranking=0)
+    Permission.objects.create(auth_group=manager, researchgroup=groups[0], ranking=10)
+    Permission.objects.create(auth_group=manager, researchgroup=groups[1], ranking=10)
+    Permission.objects.create(auth_group=head, researchgroup=groups[0], ranking=20)
+
+    people = [create_person(i, user) for i, user in enumerate(users.values())]
+    people += [create_person(i) for i in range(len(people), n_people)]
+
+    for person in people:
+        for group in rng.sample(groups, rng.randint(1, 2)):
+            joined = rng.choice([None, random_date(rng)])
+            left = None if joined is None or rng.random() < 0.5 else joined + timedelta(days=rng.randrange(3000))
+            GroupMember.objects.create(person=person, group=group, date_joined=joined, date_left=left)
+
+    contracts = []
+    proposals = []
+    for person in people:
+        for i in range(2):
+            start = random_date(rng)
+            months = rng.randint(1, 36)
+            contracts.append(Contract(
+                person=person,
+                supervisor=rng.choice(people),
+                start=start,
+                months_duration=months,
+                end=start + timedelta(days=months * 30),
+                salary=Decimal('1000.00'),
+            ))
+
+        start = random_date(rng)
+        proposals.append(ContractProposal(
+            person=person,
+            supervisor=rng.choice(people),
+            responsible=rng.choice(people),
+            start=start,
+            months_duration=12,
+            end=start + timedelta(days=365),
+            salary=Decimal('1000.00'),
+            status=rng.choice([status for status, label in ContractProposal.STATUS]),
+        ))
+
+    # bulk_create skips the signals and the notification emails
+    Contract.objects.bulk_create(contracts)
+    ContractProposal.objects.bulk_create(proposals)
+
+    return users
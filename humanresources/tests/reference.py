@@ -0,0 +1,141 @@
+"""
+Frozen copy of the original managed_by filters, joining the group
+memberships with a DISTINCT, the reference the implementations of
+managed_by are checked against. Do not optimize.
+"""
+from django.db.models import Q, F
+
+from people.models import Person
+from permissions.models import Permission
+
+from humanresources.models import Contract, ContractProposal
+
+
+def _persons_and_rankperms(user, model, required_codenames):
+    """
+    Returns None if the user has no ranked permissions, True if he can
+    manage everyone, or else the (groups, rankperms, persons) tuple.
+    """
+    ranked_permissions = Permission.objects.filter_by_auth_permissions(
+        user, model, list(required_codenames))
+
+    if not ranked_permissions.exists():
+        return None
+
+    # check if the user has permissions to all people
+    if ranked_permissions.filter(researchgroup=None).exists():
+        return True
+
+    # check which groups the user has to its people
+    groups_withaccess = [p.researchgroup for p in ranked_permissions]
+    rankings = [(p.researchgroup, p.ranking) for p in ranked_permissions]
+
+    rankfilters = Q()
+    for researchgroup, ranking in rankings:
+        rankfilters.add(Q(researchgroup=researchgroup, ranking__gte=ranking), Q.OR)
+    rankperms = Permission.objects.filter(rankfilters)
+
+    persons = Person.objects.filter(group__in=groups_withaccess)
+    persons = persons.exclude(
+        ~Q(auth_user=user) &
+        Q(auth_user__groups__rankedpermissions__in=rankperms)
+    ).distinct()
+
+    return groups_withaccess, rankperms, persons
+
+
+def _contracts_filters(user, groups_withaccess, rankperms, persons):
+    filters = Q()
+
+    # Show the contracts from the user
+    filters.add(Q(person__auth_user=user), Q.OR)
+
+    # Show the contracts the user is supervisor
+    filters.add(Q(supervisor__auth_user=user), Q.OR)
+
+    # Show the people from groups with visibility
+    filters.add(Q(
+        person__groupmember__date_joined__lte=F('start'),
+        person__groupmember__date_left__gte=F('end'),
+        person__groupmember__group__in=groups_withaccess,
+        person__in=persons
+    ), Q.OR)
+    filters.add(Q(
+        person__groupmember__date_joined__lte=F('start'),
+        person__groupmember__date_left__isnull=True,
+        person__groupmember__group__in=groups_withaccess,
+        person__in=persons
+    ), Q.OR)
+    filters.add(Q(
+        person__groupmember__date_joined__isnull=True,
+        person__groupmember__date_left__isnull=True,
+        person__groupmember__group__in=groups_withaccess,
+        person__in=persons
+    ), Q.OR)
+    return filters
+
+
+def _proposals_filters(user, groups_withaccess, rankperms, persons):
+    filters = Q()
+    # If the proposal is from the user
+    filters.add(Q(person__auth_user=user), Q.OR)
+
+    # If the proposal was submitted by the user
+    filters.add(Q(responsible__auth_user=user), Q.OR)
+
+    # If the user is the supervisor
+    filters.add(Q(supervisor__auth_user=user), Q.OR)
+
+    # Proposal supervisor is of a group managed by user
+    filters.add(Q(
+        supervisor__groupmember__group__in=groups_withaccess
+    ) & ~Q(
+        supervisor__auth_user__groups__rankedpermissions__in=rankperms
+    ), Q.OR)
+
+    # Add the group users
+    filters.add(Q(
+        person__groupmember__date_joined__lte=F('start'),
+        person__groupmember__date_left__gte=F('start'),
+        person__groupmember__group__in=groups_withaccess,
+        person__in=persons
+    ), Q.OR)
+    filters.add(Q(
+        person__groupmember__date_joined__lte=F('start'),
+        person__groupmember__date_left__isnull=True,
+        person__groupmember__group__in=groups_withaccess,
+        person__in=persons
+    ), Q.OR)
+    filters.add(Q(
+        person__groupmember__date_joined__isnull=True,
+        person__groupmember__date_left__isnull=True,
+        person__groupmember__group__in=groups_withaccess,
+        person__in=persons
+    ), Q.OR)
+    return filters
+
+
+def managed_by_reference(queryset, user, required_codenames):
+    """
+    Returns the objects of the Contract or ContractProposal queryset the
+    user manages, as the original managed_by did.
+    """
+    if user.is_superuser:
+        return queryset
+
+    access = _persons_and_rankperms(user, queryset.model, required_codenames)
+    if access is None:
+        return queryset.none()
+    if access is True:
+        return queryset
+
+    if queryset.model is Contract:
+        return queryset.filter(_contracts_filters(user, *access)).distinct()
+
+    if queryset.model is ContractProposal:
+        # Finally, exclude self proposals
+        return queryset.filter(_proposals_filters(user, *access)).exclude(
+            Q(person__auth_user=user) & ~Q(responsible__auth_user=user)
+        ).distinct()
+
+    raise ValueError('No reference managed_by for %s' % queryset.model.__name__)
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from humanresources.management.commands.check_import_time import measure
+
+
+class ImportTimeTest(SimpleTestCase):
+    """
+    Starting django does not load the PDF rendering stack, and keeps
+    humanresources.models within its import time budget.
+    """
+
+    MODULE = 'humanresources.models'
+
+    def test_lazy_modules_not_loaded(self):
+        import_ms, setup_ms, loaded = measure(self.MODULE)
+        self.assertIsNotNone(import_ms, '%s was not imported by django.setup()' % self.MODULE)
+        self.assertEqual(loaded, [])
+
+    def test_import_time_within_budget(self):
+        budget = getattr(settings, 'HUMANRESOURCES_IMPORT_TIME_BUDGET', 300)
+        # the best of a few runs, as the command reports
+        import_ms = min(measure(self.MODULE)[0] for i in range(3))
+        self.assertLessEqual(import_ms, budget)
@@ -0,0 +1,74 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from humanresources.models import Contract, ContractProposal
+
+from .factories import generate_data
+from .reference import managed_by_reference
+
+
+class ManagedByTest(TestCase):
+    """
+    Every implementation of managed_by returns the same rows as the
+    original joins and DISTINCT filter, kept in `reference`.
+    """
+
+    #: implementations of managed_by of each model
+    METHODS = {
+        Contract:         ['managed_by_cached', 'managed_by_exists'],
+        ContractProposal: ['managed_by_joins', 'managed_by_exists'],
+    }
+
+    CHECKS = [
+        (Contract,         ['view', 'change']),
+        (Contract,         ['change']),
+        (Contract,         ['delete']),
+        (ContractProposal, ['view', 'change']),
+        (ContractProposal, ['change']),
+        (ContractProposal, ['delete']),
+        (ContractProposal, ['print_proposal']),
+        (ContractProposal, ['can_approve_contract_proposal']),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = generate_data()
+
+    def setUp(self):
+        cache.clear()
+
+    def managed(self, method, user, codenames):
+        # the codenames list is modified by the permissions lookup
+        return set(method(user, list(codenames)).values_list('pk', flat=True))
+
+    def reference(self, model, user, codenames):
+        return set(managed_by_reference(model.objects.all(), user, codenames).values_list('pk', flat=True))
+
+    def test_matches_reference(self):
+        for name, user in self.users.items():
+            for model, codenames in self.CHECKS:
+                expected = self.reference(model, user, codenames)
+                for method in self.METHODS[model]:
+                    with self.subTest(user=name, model=model.__name__, codenames=codenames, method=method):
+                        objects = model.objects.all()
+                        self.assertEqual(self.managed(getattr(objects, method), user, codenames), expected)
+
+    def test_scopes(self):
+        contracts = set(Contract.objects.values_list('pk', flat=True))
+
+        managed = self.managed(Contract.objects.managed_by_exists, self.users['hr'], ['change'])
+        self.assertEqual(managed, contracts)
+
+        managed = self.managed(Contract.objects.managed_by_exists, self.users['manager'], ['change'])
+        self.assertTrue(managed)
+        self.assertLess(managed, contracts)
+
+        managed = self.managed(Contract.objects.managed_by_exists, self.users['member'], ['change'])
+        self.assertEqual(managed, set())
+
+    def test_large_scope_falls_back_to_exists(self):
+        user = self.users['manager']
+        expected = self.reference(Contract, user, ['change'])
+
+        with override_settings(HUMANRESOURCES_VISIBILITY_MAX_PERIODS=0):
+            self.assertEqual(self.managed(Contract.objects.managed_by_cached, user, ['change']), expected)
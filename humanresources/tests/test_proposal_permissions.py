@@ -0,0 +1,54 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from humanresources.models import ContractProposal
+
+from .factories import generate_data
+
+
+@override_settings(HUMANRESOURCES_MANAGED_BY_EXISTS=True)
+class ProposalPermissionsQueriesTest(TestCase):
+    """
+    With the EXISTS implementation of managed_by and the visibility
+    cached, the update and remove permission checks of the proposals
+    take two queries: the lock check and the EXISTS.
+    """
+
+    CHECKS = [
+        ('has_update_permissions', ['change']),
+        ('has_remove_permissions', ['delete']),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = generate_data()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unlocked_proposals(self):
+        proposals = ContractProposal.objects.exclude(status__in=ContractProposal.LOCKED_STATUS)
+
+        for name, user in self.users.items():
+            for check, codenames in self.CHECKS:
+                with self.subTest(user=name, check=check):
+                    # the first check caches the user visibility
+                    expected = getattr(proposals, check)(user)
+                    with self.assertNumQueries(2):
+                        self.assertEqual(getattr(proposals, check)(user), expected)
+
+                    managed = proposals.managed_by(user, list(codenames), default=proposals.owned_by(user))
+                    self.assertEqual(expected, managed.exists())
+
+    def test_locked_proposals(self):
+        proposals = ContractProposal.objects.filter(status__in=ContractProposal.LOCKED_STATUS)
+
+        for name, user in self.users.items():
+            for check, codenames in self.CHECKS:
+                with self.subTest(user=name, check=check):
+                    getattr(proposals, check)(user)
+                    managed = proposals.managed_by(user, list(codenames), default=proposals.owned_by(user))
+                    # a locked proposal found stops the check
+                    n_queries = 1 if managed.exists() else 2
+                    with self.assertNumQueries(n_queries):
+                        self.assertFalse(getattr(proposals, check)(user))
@@ -31,4 +31,6 @@ urlpatterns = [
     #     name='print_contract_proposal',
     # ),
     path('print_proposal/<int:proposal_id>/', views.print_proposal, name='print-proposal'),
+    path('export_proposals/<str:app_id>/', views.export_proposals, name='export-proposals'),
+    path('export_proposals/download/<str:token>/', views.export_proposals_download, name='export-proposals-download'),
 ]
\ No newline at end of file
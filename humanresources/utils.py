@@ -1,9 +1,20 @@
+import json
+from datetime import timedelta
+
 from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.exceptions import FieldError
-from django.core.mail import send_mail as django_send_mail
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.serializers.json import DjangoJSONEncoder
 from django.template.loader import render_to_string
 
+from humanresources import expiring_contracts, search
+
 
 def create_proposal(contract, motive, responsible):
     """
@@ -45,10 +56,115 @@ def create_proposal(contract, motive, responsible):
     return new_proposal
 
 
-def send_mail(subject, recipient_list, message_context={}):
-    """A wrapper around Django `send_mail` method.
+def bulk_insert_returns_ids():
+    """
+    True if the database returns the ids of the rows inserted with
+    bulk_create, so other rows can be linked to them.
+    """
+    features = connection.features
+    # renamed from can_return_ids_from_bulk_insert in Django 3.0
+    supported = getattr(features, 'can_return_rows_from_bulk_insert', None)
+    if supported is None:
+        supported = getattr(features, 'can_return_ids_from_bulk_insert', False)
+    return supported
+
+
+def approve_proposals(proposals, user):
+    """
+    Approve many Proposals at once and generate their Contracts and
+    Payouts, in a single transaction.
+
+    The contracts and payouts are inserted with `bulk_create`, the
+    reference objects required by the payouts orders are resolved only
+    once and the proposals are updated with `bulk_update`, so no
+    notification is sent while approving them.
+
+    Returns the list of generated contracts.
+    """
+
+    Proposal = apps.get_model('humanresources', 'ContractProposal')
+    Payment = apps.get_model('humanresources', 'Payment')
+    Contract = apps.get_model('humanresources', 'Contract')
+    Payout = apps.get_model('humanresources', 'Payout')
+    PayoutMonth = apps.get_model('humanresources', 'PayoutMonth')
+
+    # only backends returning the ids of bulk inserts allow linking the
+    # payouts to the inserted contracts
+    can_bulk_insert = bulk_insert_returns_ids()
+
+    with transaction.atomic():
+        proposals = list(
+            proposals.select_for_update().select_related(
+                'person', 'fellowship_type', 'position'
+            ).prefetch_related(
+                Prefetch('payment_set', queryset=Payment.objects.select_related('project'))
+            )
+        )
+
+        # rejected, closed or already approved proposals would get a
+        # second contract and payouts
+        not_approvable = [proposal for proposal in proposals if not proposal.is_approvable()]
+        if not_approvable:
+            raise ValidationError(
+                'The Proposals %s cannot be approved' % ', '.join(str(p.pk) for p in not_approvable)
+            )
+
+        for proposal in proposals:
+            if proposal.person is None:
+                raise ValidationError(
+                    'Select a Person from the list to approve the Proposal %s' % proposal
+                )
+            proposal.status = 'approved'
+            proposal.validate_contract_generation()
+
+        contracts = [proposal.build_contract() for proposal in proposals]
+        for contract in contracts:
+            # bulk_create does not call save(), which calculates the end
+            contract.end = contract.calculate_end()
 
-    Generates both plain text and HTML content.
+        if can_bulk_insert:
+            Contract.objects.bulk_create(contracts)
+            # bulk_create does not send the post_save signal that
+            # indexes the contracts for the search
+            search.update_index(Contract, [contract.pk for contract in contracts])
+        else:
+            for contract in contracts:
+                contract.save()
+
+        payouts = []
+        for proposal, contract in zip(proposals, contracts):
+            payouts.extend(proposal.build_payouts(contract))
+
+        lookups = Payout.order_lookups() if payouts else None
+        for payout in payouts:
+            if can_bulk_insert:
+                payout.update_order(user, lookups)
+                payout.total = payout.total_amount()
+            else:
+                payout.save(user=user, order_lookups=lookups)
+
+        if can_bulk_insert:
+            Payout.objects.bulk_create(payouts)
+            PayoutMonth.objects.bulk_create(
+                [row for payout in payouts for row in PayoutMonth.rows_for(payout)]
+            )
+
+        now = timezone.now()
+        for proposal, contract in zip(proposals, contracts):
+            proposal.contract = contract
+            proposal.status_changed = now
+            proposal.end = proposal.end_date()
+        Proposal.objects.bulk_update(proposals, ['status', 'status_changed', 'contract', 'end'])
+
+        # bulk_create does not send the post_save signals that refresh
+        # the dashboard lists
+        transaction.on_commit(expiring_contracts.invalidate)
+
+    return contracts
+
+
+def build_mail(subject, recipient_list, message_context={}):
+    """Renders the email message with both plain text and HTML content.
 
     The templates must be in `templates/emails/`.
     The message subject determines the template used. For example, for a
@@ -57,13 +173,6 @@ def send_mail(subject, recipient_list, message_context={}):
     - `templates/emails/automatic_warning.txt`
     - `templates/emails/automatic_warning.html`
     """
-
-    if not all([subject, recipient_list]):
-        # TODO Log this in the future
-        # No recipients, no message, then no need to prepare the email
-        print("WARNING: Mail not sent")
-        return
-
     template_dir = 'emails'
     template_filename = subject.lower().replace(' ', '_')
 
@@ -76,11 +185,172 @@ def send_mail(subject, recipient_list, message_context={}):
         context=message_context,
     )
 
-    django_send_mail(
+    mail = EmailMultiAlternatives(
         subject=f'[CORE] {subject}',
-        message=message,
+        body=message,
         from_email=None,
-        recipient_list=recipient_list,
-        fail_silently=False,
-        html_message=html_message,
+        to=recipient_list,
     )
+    mail.attach_alternative(html_message, 'text/html')
+    return mail
+
+
+def send_mail(subject, recipient_list, message_context={}):
+    """A wrapper around Django `send_mail` method.
+
+    Generates both plain text and HTML content, see `build_mail`.
+    """
+
+    if not all([subject, recipient_list]):
+        # TODO Log this in the future
+        # No recipients, no message, then no need to prepare the email
+        print("WARNING: Mail not sent")
+        return
+
+    build_mail(subject, recipient_list, message_context).send(fail_silently=False)
+
+
+def queue_mail(subject, recipient_list=None, recipient_group=None, message_context={}):
+    """Adds an email to the outbox, to be sent by `send_queued_emails`.
+
+    Only the outbox row is inserted, in the current transaction, so the
+    email is queued only if the transaction commits. The recipients of
+    the auth group `recipient_group` are resolved and the templates
+    rendered when the email is delivered.
+    """
+    QueuedEmail = apps.get_model('humanresources', 'QueuedEmail')
+
+    return QueuedEmail.objects.create(
+        subject=subject,
+        context=json.dumps(message_context, cls=DjangoJSONEncoder),
+        recipient_list='\n'.join(recipient_list or []),
+        recipient_group=recipient_group or '',
+    )
+
+
+def get_retry_delay(attempts):
+    """
+    Exponential backoff between the delivery attempts of a queued email.
+    """
+    base = getattr(settings, 'HUMANRESOURCES_MAIL_RETRY_DELAY', 60)
+    limit = getattr(settings, 'HUMANRESOURCES_MAIL_RETRY_MAX_DELAY', 6 * 3600)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), limit))
+
+
+def get_claim_timeout():
+    """
+    Seconds the emails claimed by a worker are hidden from the others,
+    after which they are delivered again if the worker died.
+    """
+    return getattr(settings, 'HUMANRESOURCES_MAIL_CLAIM_TIMEOUT', 600)
+
+
+def send_queued_emails(batch_size=100):
+    """Delivers the due emails of the outbox.
+
+    The batch is claimed in a short transaction, pushing its next
+    attempt past `HUMANRESOURCES_MAIL_CLAIM_TIMEOUT`, so the rows are
+    not locked while talking to the mail server. The emails are then
+    sent one by one over a single connection to the mail backend, and
+    each one is marked as sent or retried later, with an exponential
+    backoff, by its own result. An email is marked as failed after
+    `HUMANRESOURCES_MAIL_MAX_ATTEMPTS` attempts. If the mail server
+    cannot be reached the whole batch is retried, without marking any
+    email as failed.
+
+    Returns a (sent, retried, failed) tuple with the number of emails.
+    """
+    QueuedEmail = apps.get_model('humanresources', 'QueuedEmail')
+    max_attempts = getattr(settings, 'HUMANRESOURCES_MAIL_MAX_ATTEMPTS', 8)
+
+    sent = retried = failed = 0
+
+    with transaction.atomic():
+        queued = QueuedEmail.objects.filter(status='pending', next_attempt__lte=timezone.now())
+        # concurrent workers skip the emails being claimed by others
+        if connection.features.has_select_for_update_skip_locked:
+            queued = queued.select_for_update(skip_locked=True)
+        else:
+            queued = queued.select_for_update()
+        queued = list(queued.order_by('next_attempt', 'pk')[:batch_size])
+
+        QueuedEmail.objects.filter(pk__in=[email.pk for email in queued]).update(
+            next_attempt=timezone.now() + timedelta(seconds=get_claim_timeout())
+        )
+
+    if not queued:
+        return sent, retried, failed
+
+    # resolve the recipients of each auth group only once
+    groups = {}
+    for email in queued:
+        if email.recipient_group and email.recipient_group not in groups:
+            groups[email.recipient_group] = list(
+                User.objects.filter(groups__name=email.recipient_group)
+                .exclude(email='').values_list('email', flat=True)
+            )
+
+    def mark_sent(email, error=''):
+        email.status = 'sent'
+        email.sent_on = timezone.now()
+        email.last_error = error
+
+    def mark_error(email, error, can_fail=True):
+        email.last_error = '{0}: {1}'.format(type(error).__name__, error)
+        email.next_attempt = timezone.now() + get_retry_delay(email.attempts)
+        if can_fail and email.attempts >= max_attempts:
+            email.status = 'failed'
+            return False
+        return True
+
+    # render the emails, the ones failing to render are retried later
+    mails = []
+    for email in queued:
+        recipient_list = [r for r in email.recipient_list.splitlines() if r]
+        recipient_list += groups.get(email.recipient_group, [])
+
+        if not recipient_list:
+            mark_sent(email, 'No recipients')
+            sent += 1
+            continue
+
+        email.attempts += 1
+        try:
+            mails.append((email, build_mail(email.subject, recipient_list, json.loads(email.context))))
+        except Exception as e:
+            if mark_error(email, e):
+                retried += 1
+            else:
+                failed += 1
+
+    if mails:
+        mail_connection = get_connection(fail_silently=False)
+        try:
+            mail_connection.open()
+        except Exception as e:
+            # the mail server is down: retry the batch later, the emails
+            # are not at fault so none is marked as failed
+            for email, mail in mails:
+                mark_error(email, e, can_fail=False)
+            retried += len(mails)
+        else:
+            try:
+                for email, mail in mails:
+                    try:
+                        mail_connection.send_messages([mail])
+                    except Exception as e:
+                        if mark_error(email, e):
+                            retried += 1
+                        else:
+                            failed += 1
+                    else:
+                        mark_sent(email)
+                        sent += 1
+            finally:
+                mail_connection.close()
+
+    QueuedEmail.objects.bulk_update(
+        queued, ['status', 'attempts', 'next_attempt', 'last_error', 'sent_on']
+    )
+
+    return sent, retried, failed
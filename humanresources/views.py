@@ -1,5 +1,11 @@
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.shortcuts import redirect
+from django.utils.html import format_html
+from django.views.decorators.cache import never_cache
+from pyforms_web.web import ApplicationsLoader
 from humanresources.models import ContractProposal
+from humanresources.pdf_export import start_export, get_export, FORMAT_PDF, FORMAT_ZIP
 
 
 def print_proposal(request, proposal_id):
@@ -9,5 +15,64 @@ def print_proposal(request, proposal_id):
     if not queryset.has_print_permissions(request.user):
         return HttpResponse('No permissions')
 
-    proposal = ContractProposal.objects.get(pk=proposal_id)
+    proposal = queryset.select_related(
+        'person', 'supervisor', 'position', 'fellowship_type'
+    ).prefetch_related('payment_set__project').get()
     return proposal.generate_pdf_view(request)
+
+
+@never_cache
+def export_proposals(request, app_id):
+    """
+    Starts the export to PDF of the proposals listed, with the current
+    filters, by the proposals list application. The export runs in a
+    background process, see `pdf_export.start_export`, and the page
+    links to its download.
+    """
+    app = ApplicationsLoader.get_instance(request, app_id)
+    if app is None:
+        return HttpResponse('The application is no longer available')
+
+    queryset = app._list.value.managed_by(request.user, ['print_proposal'])
+    proposal_ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+    if not proposal_ids:
+        return HttpResponse('No proposals to export')
+
+    output = FORMAT_PDF if request.GET.get('format') == FORMAT_PDF else FORMAT_ZIP
+    token = start_export(
+        request.user,
+        proposal_ids,
+        output=output,
+        timeout=getattr(settings, 'HUMANRESOURCES_PDF_EXPORT_TIMEOUT', 60),
+        base_url=request.build_absolute_uri('/'),
+    )
+    return redirect('export-proposals-download', token=token)
+
+
+@never_cache
+def export_proposals_download(request, token):
+    """
+    Downloads the file of the export once it is written, until then the
+    page reloads itself.
+    """
+    export = get_export(token, request.user)
+    if export is None:
+        return HttpResponse('The export is no longer available')
+
+    if export['path'] is not None:
+        response = FileResponse(
+            open(export['path'], 'rb'),
+            content_type='application/pdf' if export['output'] == FORMAT_PDF else 'application/zip',
+        )
+        response['Content-Disposition'] = 'attachment; filename="proposals.{0}"'.format(export['output'])
+        return response
+
+    if export['error'] is not None:
+        return HttpResponse(format_html('The export failed: {0}', export['error']))
+
+    return HttpResponse(format_html(
+        '<html><head><meta http-equiv="refresh" content="5"></head><body>'
+        'Exporting {0} proposals, the download starts when the file is ready.'
+        '</body></html>',
+        export['documents'],
+    ))
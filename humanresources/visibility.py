@@ -0,0 +1,155 @@
+"""
+Per-user cache of the people a user is allowed to manage, given his
+ranked permissions. The entries are invalidated by the signals in
+`signals.py` when memberships, permissions or auth groups change.
+"""
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from people.models import Person
+from permissions.models import Permission
+
+
+SCOPE_NONE   = 'none'    #: the user has no ranked permissions
+SCOPE_ALL    = 'all'     #: the user can manage everyone
+SCOPE_GROUPS = 'groups'  #: the user can manage the people of some groups
+
+GENERATION_KEY = 'humanresources:visibility:generation'
+VERSION = 2  #: format of the cached entries
+
+
+def get_timeout():
+    return getattr(settings, 'HUMANRESOURCES_VISIBILITY_CACHE_TIMEOUT', 300)
+
+
+def get_max_periods():
+    return getattr(settings, 'HUMANRESOURCES_VISIBILITY_MAX_PERIODS', 50)
+
+
+def get_max_persons():
+    return getattr(settings, 'HUMANRESOURCES_VISIBILITY_MAX_PERSONS', 1000)
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = 0
+        cache.add(GENERATION_KEY, generation, None)
+    return generation
+
+
+def invalidate():
+    """
+    Invalidates the cached visibility of every user.
+    """
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def compute_visibility(user, model, codenames):
+    """
+    Resolves the ranked permissions of the user for the model and
+    codenames. Returns a dict with the `scope` and, for the groups
+    scope, the ids of the research `groups` with access, of the
+    `persons` the user can see in those groups and their `memberships`
+    of those groups, as (person, date_joined, date_left) tuples.
+    """
+    ranked_permissions = Permission.objects.filter_by_auth_permissions(
+        user, model, list(codenames))
+    rankings = list(ranked_permissions.values_list('researchgroup', 'ranking'))
+
+    if not rankings:
+        return {'scope': SCOPE_NONE}
+
+    # check if the user has permissions to all people
+    if any(researchgroup is None for researchgroup, ranking in rankings):
+        return {'scope': SCOPE_ALL}
+
+    # check which groups the user has to its people
+    groups_withaccess = [researchgroup for researchgroup, ranking in rankings]
+
+    rankfilters = Q()
+    for researchgroup, ranking in rankings:
+        rankfilters.add(Q(researchgroup=researchgroup, ranking__gte=ranking), Q.OR)
+    rankperms = Permission.objects.filter(rankfilters)
+
+    persons = Person.objects.filter(group__in=groups_withaccess)
+    persons = persons.exclude(
+        ~Q(auth_user=user) &
+        Q(auth_user__groups__rankedpermissions__in=rankperms)
+    ).distinct()
+
+    persons = list(persons.values_list('pk', flat=True))
+    GroupMember = apps.get_model('people', 'GroupMember')
+    memberships = GroupMember.objects.filter(group__in=groups_withaccess, person__in=persons)
+
+    return {
+        'scope':       SCOPE_GROUPS,
+        'groups':      groups_withaccess,
+        'persons':     persons,
+        'memberships': list(memberships.values_list('person', 'date_joined', 'date_left').distinct()),
+    }
+
+
+def memberships_filter(visibility, start='start', end='end'):
+    """
+    Returns the Q filtering the objects of the people that were members
+    of a group with visibility between the dates of the start and end
+    fields, from the memberships of the visibility, without joining the
+    memberships table.
+
+    The Q has an OR branch, with an IN list of people, per distinct
+    membership period. Returns None if there are more periods than
+    HUMANRESOURCES_VISIBILITY_MAX_PERIODS or more people than
+    HUMANRESOURCES_VISIBILITY_MAX_PERSONS, so large scopes are checked
+    with an EXISTS subquery instead.
+    """
+    always = set()
+    periods = defaultdict(set)
+    for person, date_joined, date_left in visibility['memberships']:
+        if date_joined is None and date_left is None:
+            always.add(person)
+        elif date_joined is not None:
+            periods[date_joined, date_left].add(person)
+
+    for persons in periods.values():
+        persons -= always
+    periods = {period: persons for period, persons in periods.items() if persons}
+
+    n_persons = len(always) + sum(len(persons) for persons in periods.values())
+    if len(periods) > get_max_periods() or n_persons > get_max_persons():
+        return None
+
+    filters = Q(person_id__in=sorted(always))
+    for (date_joined, date_left), persons in periods.items():
+        if date_left is None:
+            period = Q(**{start + '__gte': date_joined})
+        else:
+            period = Q(**{start + '__gte': date_joined, end + '__lte': date_left})
+        filters |= Q(person_id__in=sorted(persons)) & period
+    return filters
+
+
+def get_visibility(user, model, codenames):
+    """
+    Cached version of `compute_visibility`.
+    """
+    key = 'humanresources:visibility:{version}:{generation}:{user}:{model}:{codenames}'.format(
+        version=VERSION,
+        generation=get_generation(),
+        user=user.pk,
+        model=model._meta.label_lower,
+        codenames=','.join(sorted(codenames)),
+    )
+
+    visibility = cache.get(key)
+    if visibility is None:
+        visibility = compute_visibility(user, model, codenames)
+        cache.set(key, visibility, get_timeout())
+    return visibility
@@ -26,10 +26,11 @@ setup(
     long_description_content_type='text/markdown',
     packages=find_packages(),
     license=license,
+    python_requires='>=3.7',
     install_requires=[
         'django-localflavor',
+        'numpy',
         'weasyprint',
-        'django-weasyprint',
         'django-model-utils',
         'django-money',
         'core-common',